@@ -0,0 +1,195 @@
+"""Benchmark offline do pipeline do push.py.
+
+Troca o yt-dlp por um extrator falso (info dicts prontos, com latência e
+falhas configuráveis) e o YouTube por um servidor HTTP local que gera
+playlists HLS e segmentos sintéticos. Mede canais/s, p50/p95 por estágio
+e pico de RSS sem precisar de rede.
+
+Uso:
+    python benchmark.py                      # 10, 1 000 e 10 000 canais
+    python benchmark.py --tamanhos 100 500 --latencia 0.05 --falhas 0.1
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+import yt_dlp
+
+import push
+
+class ServidorHLS(BaseHTTPRequestHandler):
+    """Serve /master/<id>.m3u8, /media/<id>.m3u8 e /seg/<id>/<n>.ts sintéticos."""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    SEGMENTO = bytes(188) * 64
+
+    def do_GET(self):
+        partes = self.path.strip("/").split("/")
+        if partes[0] == "master" and len(partes) == 2:
+            canal = partes[1].removesuffix(".m3u8")
+            corpo = (
+                "#EXTM3U\n"
+                '#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=854x480,CODECS="avc1.4d401e,mp4a.40.2"\n'
+                f"/media/{canal}.m3u8\n"
+                '#EXT-X-STREAM-INF:BANDWIDTH=4500000,RESOLUTION=1920x1080,CODECS="avc1.640028,mp4a.40.2"\n'
+                f"/media/{canal}.m3u8\n"
+            ).encode()
+            tipo = "application/vnd.apple.mpegurl"
+        elif partes[0] == "media" and len(partes) == 2:
+            canal = partes[1].removesuffix(".m3u8")
+            corpo = "#EXTM3U\n#EXT-X-TARGETDURATION:2\n#EXT-X-MEDIA-SEQUENCE:0\n".encode()
+            corpo += "".join(f"#EXTINF:2.0,\n/seg/{canal}/{n}.ts\n" for n in range(3)).encode()
+            tipo = "application/vnd.apple.mpegurl"
+        elif partes[0] == "seg":
+            corpo = self.SEGMENTO
+            tipo = "video/mp2t"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+class ExtratorFalso:
+    """Substitui YoutubeDL.extract_info devolvendo info dicts prontos apontando para o servidor local.
+
+    A troca é no extract_info, e não em Resolvedor.extrair, para que cada
+    thread crie seu YoutubeDL na extração como em produção: do contrário a
+    primeira seleção de formatos da thread pagaria a criação da instância.
+    """
+    def __init__(self, base: str, latencia: float, falhas: float, offline: float, semente: int = 42):
+        self.base = base
+        self.latencia = latencia
+        self.falhas = falhas
+        self.offline = offline
+        self._aleatorio = random.Random(semente)
+        self._lock = threading.Lock()
+
+    def __call__(self, url: str, download: bool = True, **kwargs) -> Dict:
+        with self._lock:
+            sorteio = self._aleatorio.random()
+            atraso = self._aleatorio.expovariate(1 / self.latencia) if self.latencia else 0
+        time.sleep(atraso)
+        canal = url.rsplit("/", 1)[-1]
+        if sorteio < self.falhas:
+            raise yt_dlp.utils.DownloadError(f"ERROR: [youtube] {canal}: Unable to connect (falha simulada)")
+        if sorteio < self.falhas + self.offline:
+            return {"id": canal, "title": f"Canal {canal}", "is_live": False}
+        return {
+            "id": canal,
+            "title": f"Canal {canal} AO VIVO",
+            "is_live": True,
+            "formats": [{
+                "format_id": "95", "url": f"{self.base}/master/{canal}.m3u8", "ext": "mp4",
+                "protocol": "m3u8_native", "width": 1280, "height": 720, "tbr": 2500,
+                "vcodec": "avc1.4d401f", "acodec": "mp4a.40.2",
+            }],
+        }
+
+def rodar(n: int, args: argparse.Namespace) -> Dict:
+    """Executa o pipeline para `n` canais falsos e devolve as métricas da rodada."""
+    push.Logger.ouvintes = []
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), ServidorHLS)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{servidor.server_address[1]}"
+
+    extrator = ExtratorFalso(base, args.latencia, args.falhas, args.offline)
+    yt_dlp.YoutubeDL.extract_info = lambda ydl, url, **kwargs: extrator(url, **kwargs)
+
+    canais = [
+        {"original": f"https://www.youtube.com/@bench/{i}", "logo": "", "grupo": "Benchmark"}
+        for i in range(n)
+    ]
+    with tempfile.TemporaryDirectory() as pasta:
+        # atualizar_playlist grava lives.m3u8 e Hhshs/TV-FIX.m3u relativos ao diretório atual
+        origem = os.getcwd()
+        os.chdir(pasta)
+        try:
+            inicio = time.perf_counter()
+            resultados = asyncio.run(push.processar_canais(
+                canais,
+                resolvedores=args.resolvedores,
+                verificadores=args.verificadores,
+                tentativas=args.tentativas,
+            ))
+            push.atualizar_playlist(resultados, [push.SaidaM3U("lives.m3u8")])
+            fim = time.perf_counter()
+        finally:
+            os.chdir(origem)
+    servidor.shutdown()
+    metricas = push.METRICAS.relatorio()
+
+    return {
+        "canais": n,
+        "ao_vivo": sum(1 for r in resultados if r["url"]),
+        "segundos": fim - inicio,
+        "canais_por_segundo": n / (fim - inicio),
+        "estagios": metricas["estagios"],
+        "contadores": metricas["contadores"],
+        "pico_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+def imprimir(relatorio: Dict):
+    print(f"\n{relatorio['canais']} canais ({relatorio['ao_vivo']} ao vivo): "
+          f"{relatorio['segundos']:.2f}s, {relatorio['canais_por_segundo']:.1f} canais/s, "
+          f"pico RSS {relatorio['pico_rss_mb']:.1f} MB")
+    for estagio, medidas in relatorio["estagios"].items():
+        print(f"  {estagio:<14} p50 {medidas['p50'] * 1000:8.2f} ms   "
+              f"p95 {medidas['p95'] * 1000:8.2f} ms   ({medidas['amostras']} amostras)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline do pipeline do push.py")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--latencia", type=float, default=0.2, help="Latência média do extrator falso (s)")
+    parser.add_argument("--falhas", type=float, default=0.02, help="Fração de extrações que falham")
+    parser.add_argument("--offline", type=float, default=0.5, help="Fração de canais fora do ar")
+    parser.add_argument("--resolvedores", type=int, default=8)
+    parser.add_argument("--verificadores", type=int, default=16)
+    parser.add_argument("--tentativas", type=int, help="Teto de tentativas (padrão: o de cada classe)")
+    parser.add_argument("--json", help="Grava os relatórios neste arquivo")
+    parser.add_argument("--interno", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.interno is not None:
+        print(json.dumps(rodar(args.interno, args)))
+        return
+
+    # Cada tamanho roda num processo próprio para que o pico de RSS seja só dele
+    repassados = [
+        "--latencia", str(args.latencia), "--falhas", str(args.falhas), "--offline", str(args.offline),
+        "--resolvedores", str(args.resolvedores), "--verificadores", str(args.verificadores),
+    ]
+    if args.tentativas is not None:
+        repassados += ["--tentativas", str(args.tentativas)]
+    relatorios = []
+    for n in args.tamanhos:
+        filho = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--interno", str(n), *repassados],
+            capture_output=True, text=True, check=True
+        )
+        relatorio = json.loads(filho.stdout.strip().splitlines()[-1])
+        imprimir(relatorio)
+        relatorios.append(relatorio)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(relatorios, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,27 @@ import re
 import time
 import os
 import json
+import math
+import random
 import shutil
-from typing import List, Dict, Tuple, Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import sqlite3
+import argparse
+import contextlib
+import asyncio
+import hashlib
+import heapq
+import html
+import threading
+import http.client
+import http.cookiejar
+import urllib.parse
+from collections import OrderedDict
+from typing import IO, Callable, Iterator, List, Dict, NamedTuple, Tuple, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape, quoteattr
 import yt_dlp
+from yt_dlp.cookies import YoutubeDLCookieJar
 
 class Estilos:
     VERMELHO = '\033[38;5;196m'
@@ -18,52 +35,231 @@ class Estilos:
     NEGRITO = '\033[1m'
     FUNDO_VERDE = '\033[48;5;28m'
 
+class RenderizadorConsole:
+    """Ouvinte padrão do Logger: a saída colorida com emoji de sempre."""
+    FORMATOS = {
+        "cabecalho": f"\n{Estilos.FUNDO_VERDE}{Estilos.NEGRITO} 🌟 === {{msg}} === 🌟 {Estilos.RESET}",
+        "sucesso": f"{Estilos.VERDE}  ✅  {{msg:<60}}{Estilos.RESET}",
+        "aviso": f"{Estilos.AMARELO}  ⚠️  {{msg:<60}}{Estilos.RESET}",
+        "erro": f"{Estilos.VERMELHO}  ❌  {{msg:<60}}{Estilos.RESET}",
+        "processo": f"{Estilos.MAGENTA}  ⏳  {{msg:<60}}{Estilos.RESET}",
+        "debug": f"{Estilos.CIANO}  🛠️  {{msg:<60}}{Estilos.RESET}",
+        "separador": f"{Estilos.CIANO}✨ {'='*68} ✨{Estilos.RESET}",
+    }
+
+    def __call__(self, nivel: str, msg: str):
+        if nivel == "cabecalho":
+            msg = msg.upper()
+        print(self.FORMATOS[nivel].format(msg=msg))
+
 class Logger:
+    """Fachada de eventos de log; o console é só um dos ouvintes.
+
+    Nos caminhos quentes a mensagem vem como modelo mais argumentos
+    (`Logger.debug("HTTP {} 🧪", status)`) e só é formatada se houver ouvinte;
+    com --silencioso não há nenhum e nada é formatado nem impresso. Avisos e
+    erros são sempre contados em `contagem`, que entra no relatório de métricas.
+    """
+    ouvintes: List[Callable[[str, str], None]] = [RenderizadorConsole()]
+    contagem: Dict[str, int] = {"aviso": 0, "erro": 0}
+    _lock = threading.Lock()
+
+    @classmethod
+    def emitir(cls, nivel: str, msg: str = "", args: tuple = ()):
+        if args:
+            msg = msg.format(*args)
+        for ouvinte in cls.ouvintes:
+            ouvinte(nivel, msg)
+
+    @classmethod
+    def contar(cls, nivel: str):
+        with cls._lock:
+            cls.contagem[nivel] += 1
+
     @staticmethod
-    def cabecalho(msg: str):
-        print(f"\n{Estilos.FUNDO_VERDE}{Estilos.NEGRITO} 🌟 === {msg.upper()} === 🌟 {Estilos.RESET}")
+    def cabecalho(msg: str, *args):
+        if Logger.ouvintes:
+            Logger.emitir("cabecalho", msg, args)
 
     @staticmethod
-    def sucesso(msg: str):
-        print(f"{Estilos.VERDE}  ✅  {msg:<60}{Estilos.RESET}")
+    def sucesso(msg: str, *args):
+        if Logger.ouvintes:
+            Logger.emitir("sucesso", msg, args)
 
     @staticmethod
-    def aviso(msg: str):
-        print(f"{Estilos.AMARELO}  ⚠️  {msg:<60}{Estilos.RESET}")
+    def aviso(msg: str, *args):
+        Logger.contar("aviso")
+        if Logger.ouvintes:
+            Logger.emitir("aviso", msg, args)
 
     @staticmethod
-    def erro(msg: str):
-        print(f"{Estilos.VERMELHO}  ❌  {msg:<60}{Estilos.RESET}")
+    def erro(msg: str, *args):
+        Logger.contar("erro")
+        if Logger.ouvintes:
+            Logger.emitir("erro", msg, args)
 
     @staticmethod
-    def processo(msg: str):
-        print(f"{Estilos.MAGENTA}  ⏳  {msg:<60}{Estilos.RESET}")
+    def processo(msg: str, *args):
+        if Logger.ouvintes:
+            Logger.emitir("processo", msg, args)
 
     @staticmethod
-    def debug(msg: str):
-        print(f"{Estilos.CIANO}  🛠️  {msg:<60}{Estilos.RESET}")
+    def debug(msg: str, *args):
+        if Logger.ouvintes:
+            Logger.emitir("debug", msg, args)
 
     @staticmethod
     def separador():
-        print(f"{Estilos.CIANO}✨ {'='*68} ✨{Estilos.RESET}")
+        if Logger.ouvintes:
+            Logger.emitir("separador")
 
-def verificar_dependencias() -> bool:
-    Logger.cabecalho("Verificação de Dependências")
+class Metricas:
+    """Cronômetros e contadores por canal e por estágio de uma execução.
+
+    Os estágios são pre_checagem (página do canal), extracao (yt-dlp),
+    resolucao_url (seleção de formatos), verificacao (probe), escada (master
+    playlist), renderizacao (saídas), mescla (TV-FIX.m3u)
+    e sob_demanda (servidor).
+    O relatório final sai em JSON e, opcionalmente, no formato texto do Prometheus.
+    """
+    def __init__(self):
+        self.inicio = time.time()
+        self.duracoes: Dict[str, List[float]] = {}
+        self.contadores: Dict[str, int] = {}
+        self.canais: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def reiniciar(self):
+        """Zera as medições (o daemon grava um relatório por lote e recomeça)."""
+        with self._lock:
+            self.inicio = time.time()
+            self.duracoes = {}
+            self.contadores = {}
+            self.canais = {}
+        with Logger._lock:
+            Logger.contagem = {nivel: 0 for nivel in Logger.contagem}
+
+    def _canal(self, canal: str) -> Dict:
+        return self.canais.setdefault(canal, {"estagios": {}, "contadores": {}, "status": None})
+
+    def registrar(self, estagio: str, duracao: float, canal: Optional[str] = None):
+        with self._lock:
+            self.duracoes.setdefault(estagio, []).append(duracao)
+            if canal is not None:
+                estagios = self._canal(canal)["estagios"]
+                estagios[estagio] = estagios.get(estagio, 0.0) + duracao
+
+    @contextlib.contextmanager
+    def medir(self, estagio: str, canal: Optional[str] = None) -> Iterator[None]:
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(estagio, time.perf_counter() - inicio, canal)
+
+    def contar(self, nome: str, canal: Optional[str] = None, n: int = 1):
+        with self._lock:
+            self.contadores[nome] = self.contadores.get(nome, 0) + n
+            if canal is not None:
+                contadores = self._canal(canal)["contadores"]
+                contadores[nome] = contadores.get(nome, 0) + n
+
+    def marcar_status(self, canal: str, status: str):
+        with self._lock:
+            self._canal(canal)["status"] = status
+
+    @staticmethod
+    def _resumo(valores: List[float]) -> Dict[str, float]:
+        ordenados = sorted(valores)
+        def quantil(q: float) -> float:
+            return ordenados[min(len(ordenados) - 1, int(round(q * (len(ordenados) - 1))))]
+        return {
+            "amostras": len(ordenados), "total": sum(ordenados), "p50": quantil(0.5),
+            "p95": quantil(0.95), "max": ordenados[-1],
+        }
+
+    def relatorio(self) -> Dict:
+        with self._lock:
+            status: Dict[str, int] = {}
+            for dados in self.canais.values():
+                if dados["status"]:
+                    status[dados["status"]] = status.get(dados["status"], 0) + 1
+            return {
+                "inicio": self.inicio,
+                "duracao": time.time() - self.inicio,
+                "estagios": {estagio: self._resumo(valores) for estagio, valores in self.duracoes.items()},
+                "contadores": {
+                    **self.contadores,
+                    **{f"log_{nivel}": n for nivel, n in Logger.contagem.items() if n},
+                },
+                "status": status,
+                "canais": {canal: {**dados} for canal, dados in self.canais.items()},
+            }
+
+    def salvar_json(self, caminho: str):
+        with arquivo_atomico(caminho) as f:
+            json.dump(self.relatorio(), f, ensure_ascii=False, indent=2)
+
+    def salvar_prometheus(self, caminho: str):
+        relatorio = self.relatorio()
+        linhas = [
+            "# HELP push_execucao_segundos Duração total da execução.",
+            "# TYPE push_execucao_segundos gauge",
+            f"push_execucao_segundos {relatorio['duracao']:.6f}",
+            "# HELP push_estagio_segundos Duração de cada estágio por canal.",
+            "# TYPE push_estagio_segundos summary",
+        ]
+        for estagio, resumo in relatorio["estagios"].items():
+            linhas += [
+                f'push_estagio_segundos{{estagio="{estagio}",quantile="0.5"}} {resumo["p50"]:.6f}',
+                f'push_estagio_segundos{{estagio="{estagio}",quantile="0.95"}} {resumo["p95"]:.6f}',
+                f'push_estagio_segundos_sum{{estagio="{estagio}"}} {resumo["total"]:.6f}',
+                f'push_estagio_segundos_count{{estagio="{estagio}"}} {resumo["amostras"]}',
+            ]
+        linhas += ["# HELP push_eventos_total Contadores da execução.", "# TYPE push_eventos_total counter"]
+        linhas += [f'push_eventos_total{{nome="{nome}"}} {valor}' for nome, valor in relatorio["contadores"].items()]
+        linhas += ["# HELP push_canais Canais por status final.", "# TYPE push_canais gauge"]
+        linhas += [f'push_canais{{status="{nome}"}} {valor}' for nome, valor in relatorio["status"].items()]
+        with arquivo_atomico(caminho) as f:
+            f.write("\n".join(linhas) + "\n")
+
+METRICAS = Metricas()
+
+@contextlib.contextmanager
+def arquivo_atomico(caminho: str, modo: str = "w") -> Iterator[IO]:
+    """Escreve num temporário ao lado de `caminho` e só o troca pelo definitivo se tudo der certo.
+
+    Um job interrompido no meio da escrita deixa o arquivo anterior intacto.
+    """
+    temporario = f"{caminho}.tmp"
+    f = open(temporario, modo, **({} if "b" in modo else {"encoding": "utf-8"}))
     try:
-        result = subprocess.run(["yt-dlp", "--version"], capture_output=True, text=True, check=True)
-        Logger.sucesso(f"yt-dlp versão: {result.stdout.strip()} 🎉")
-    except (subprocess.CalledProcessError, FileNotFoundError) as e:
-        Logger.erro(f"yt-dlp não encontrado: {str(e)} 😞")
-        print(f"\n  📌 Instale com: {Estilos.NEGRITO}pip install yt-dlp{Estilos.RESET}\n")
-        return False
+        yield f
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        os.replace(temporario, caminho)
+    except BaseException:
+        f.close()
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+def verificar_dependencias(exigir_ffmpeg: bool = True) -> bool:
+    Logger.cabecalho("Verificação de Dependências")
+    # yt-dlp é usado em processo; se o import no topo funcionou, ele está disponível
+    Logger.sucesso(f"yt-dlp versão: {yt_dlp.version.__version__} 🎉")
 
     try:
         subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True, check=True)
         Logger.sucesso("FFmpeg instalado com sucesso! 🎥")
     except (subprocess.CalledProcessError, FileNotFoundError) as e:
-        Logger.erro(f"FFmpeg não encontrado: {str(e)} 😞")
-        print(f"\n  📌 Instale com: {Estilos.NEGRITO}sudo apt install ffmpeg{Estilos.RESET}\n")
-        return False
+        if not exigir_ffmpeg:
+            Logger.aviso("FFmpeg não encontrado (só é usado com --probe-profundo) 🤔")
+        else:
+            Logger.erro(f"FFmpeg não encontrado: {str(e)} 😞")
+            print(f"\n  📌 Instale com: {Estilos.NEGRITO}sudo apt install ffmpeg{Estilos.RESET}\n")
+            return False
 
     # Verificação opcional de ffplay e vlc
     for tool in ["ffplay", "vlc"]:
@@ -74,73 +270,958 @@ def verificar_dependencias() -> bool:
             Logger.aviso(f"{tool} não encontrado (opcional para testes) 🤔")
     return True
 
-def testar_url(url: str, timeout: int = 15) -> bool:
+class SessaoHTTP:
+    """Pool de conexões HTTP(S) keep-alive, uma por host em cada thread.
+
+    Os probes de manifesto fazem várias requisições pequenas ao mesmo host
+    (master, media playlist, segmento); reaproveitar a conexão evita um
+    handshake TLS por requisição. Cada thread guarda no máximo `max_conexoes`
+    hosts (LRU); a menos usada é fechada para o número de sockets não crescer
+    com a quantidade de hosts do googlevideo vistos na execução.
+    """
+    _local = threading.local()
+    AGENTE = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+
+    def __init__(self, timeout: int = 10, max_conexoes: int = 4):
+        self.timeout = timeout
+        self.max_conexoes = max_conexoes
+
+    def _conexao(self, esquema: str, host: str) -> http.client.HTTPConnection:
+        conexoes = getattr(self._local, "conexoes", None)
+        if conexoes is None:
+            conexoes = self._local.conexoes = OrderedDict()
+        conexao = conexoes.get((esquema, host))
+        if conexao is None:
+            while len(conexoes) >= self.max_conexoes:
+                conexoes.popitem(last=False)[1].close()
+            classe = http.client.HTTPSConnection if esquema == "https" else http.client.HTTPConnection
+            conexao = conexoes[(esquema, host)] = classe(host, timeout=self.timeout)
+        else:
+            conexoes.move_to_end((esquema, host))
+        return conexao
+
+    def _descartar(self, esquema: str, host: str):
+        conexao = self._local.conexoes.pop((esquema, host), None)
+        if conexao is not None:
+            conexao.close()
+
+    def obter(self, url: str, cabecalhos: Optional[Dict[str, str]] = None, limite: int = 2 * 1024 * 1024,
+              redirecionamentos: int = 5) -> Tuple[int, bytes, str]:
+        """GET que lê no máximo `limite` bytes do corpo; devolve (status, corpo, url final)."""
+        for _ in range(redirecionamentos + 1):
+            partes = urllib.parse.urlsplit(url)
+            caminho = urllib.parse.urlunsplit(("", "", partes.path or "/", partes.query, ""))
+            enviados = {"User-Agent": self.AGENTE, **(cabecalhos or {})}
+            for reenvio in range(2):
+                conexao = self._conexao(partes.scheme, partes.netloc)
+                try:
+                    conexao.request("GET", caminho, headers=enviados)
+                    resposta = conexao.getresponse()
+                    break
+                except (http.client.HTTPException, OSError):
+                    # Conexão keep-alive fechada pelo servidor: tenta uma vez com conexão nova
+                    self._descartar(partes.scheme, partes.netloc)
+                    if reenvio:
+                        raise
+
+            if resposta.status in (301, 302, 303, 307, 308) and resposta.getheader("Location"):
+                resposta.read()
+                url = urllib.parse.urljoin(url, resposta.getheader("Location"))
+                continue
+
+            corpo = resposta.read(limite)
+            if not resposta.isclosed():
+                # Corpo maior que o limite: a conexão não pode ser reaproveitada
+                self._descartar(partes.scheme, partes.netloc)
+            return resposta.status, corpo, url
+        raise http.client.HTTPException(f"Redirecionamentos demais: {url}")
+
+SESSAO_HTTP = SessaoHTTP()
+
+CODECS_AUDIO = ("mp4a", "ac-3", "ec-3", "opus", "mp3", "vorbis", "flac")
+
+def ler_atributos(linha: str) -> Dict[str, str]:
+    """Atributos de uma tag HLS (#EXT-X-STREAM-INF:BANDWIDTH=...,CODECS="...")."""
+    return {
+        chave: valor.strip('"')
+        for chave, valor in re.findall(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)', linha.split(":", 1)[-1])
+    }
+
+class Variante(NamedTuple):
+    """Um degrau da escada HLS: URL da media playlist, resolução, banda, codecs e se tem áudio."""
+    url: str
+    largura: int
+    altura: int
+    banda: int
+    codecs: str
+    audio: bool
+
+def ler_variantes(texto: str, base: str) -> List[Variante]:
+    """Escada de variantes de uma master playlist (vazia se `texto` já for uma media playlist)."""
+    linhas = [linha.strip() for linha in texto.splitlines() if linha.strip()]
+    grupos_audio = {
+        ler_atributos(linha).get("GROUP-ID") for linha in linhas
+        if linha.startswith("#EXT-X-MEDIA") and ler_atributos(linha).get("TYPE") == "AUDIO"
+    }
+    variantes = []
+    for i, linha in enumerate(linhas[:-1]):
+        if not linha.startswith("#EXT-X-STREAM-INF"):
+            continue
+        atributos = ler_atributos(linha)
+        codecs = atributos.get("CODECS")
+        largura, _, altura = atributos.get("RESOLUTION", "").partition("x")
+        banda = atributos.get("BANDWIDTH", "")
+        variantes.append(Variante(
+            url=urllib.parse.urljoin(base, linhas[i + 1]),
+            largura=int(largura) if largura.isdigit() else 0,
+            altura=int(altura) if altura.isdigit() else 0,
+            banda=int(banda) if banda.isdigit() else 0,
+            codecs=codecs or "",
+            audio=codecs is None or any(c in codecs for c in CODECS_AUDIO) or atributos.get("AUDIO") in grupos_audio,
+        ))
+    return variantes
+
+def escada_de_variantes(url: str) -> List[Variante]:
+    """Baixa a master playlist uma vez e devolve todas as variantes; lista vazia se não for HLS."""
+    try:
+        status, corpo, url = SESSAO_HTTP.obter(url)
+    except (http.client.HTTPException, OSError) as e:
+        Logger.debug("Falha ao ler a escada de variantes: {} 🪜", e)
+        return []
+    if status != 200 or not corpo.startswith(b"#EXTM3U"):
+        return []
+    return ler_variantes(corpo.decode("utf-8", "replace"), url)
+
+def escolher_variante(variantes: List[Variante], altura: int) -> Optional[Variante]:
+    """A melhor variante com áudio até `altura` linhas; sem nenhuma, a menor disponível."""
+    com_audio = [v for v in variantes if v.audio]
+    cabem = [v for v in com_audio if v.altura <= altura]
+    if cabem:
+        return max(cabem, key=lambda v: (v.altura, v.banda))
+    return min(com_audio, key=lambda v: (v.altura, v.banda), default=None)
+
+def testar_url_ffmpeg(url: str, timeout: int = 15) -> bool:
     try:
         cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", url, "-t", "5", "-f", "null", "-"]
         subprocess.run(cmd, check=True, capture_output=True, timeout=timeout)
         return True
     except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
-        Logger.debug(f"Teste de URL falhou: {str(e)} 🧪")
+        Logger.debug("Teste de URL falhou: {} 🧪", e)
         return False
     except Exception as e:
         Logger.erro(f"Erro inesperado ao testar URL: {str(e)} 💥")
         return False
 
-def obter_stream_com_audio(url: str, tentativas: int = 3, timeout_base: int = 20) -> Tuple[Optional[str], Optional[str]]:
-    formatos_priorizados = [
-        "best[height<=1080][acodec!=none][protocol=hls]",
-        "bestvideo[height<=1080]+bestaudio/best[height<=1080]",
-        "best[acodec!=none]",
-        "best"
-    ]
+def testar_manifesto(url: str) -> bool:
+    """Probe leve: master playlist -> variante com áudio -> media playlist -> 1 KB do primeiro segmento."""
+    status, corpo, url = SESSAO_HTTP.obter(url)
+    if status != 200:
+        Logger.debug("Manifesto respondeu HTTP {} 🧪", status)
+        return False
+    if not corpo.startswith(b"#EXTM3U"):
+        # Não é HLS (stream progressivo): o servidor entregar dados já basta
+        return bool(corpo)
+
+    texto = corpo.decode("utf-8", "replace")
+    linhas = [linha.strip() for linha in texto.splitlines() if linha.strip()]
+    variantes = ler_variantes(texto, url)
+    if variantes:
+        variante = next((v.url for v in variantes if v.audio), None)
+        if variante is None:
+            Logger.debug("Nenhuma variante com áudio no manifesto 🔇")
+            return False
+        status, corpo, url = SESSAO_HTTP.obter(variante)
+        if status != 200 or not corpo.startswith(b"#EXTM3U"):
+            Logger.debug("Media playlist inválida (HTTP {}) 🧪", status)
+            return False
+        linhas = [linha.strip() for linha in corpo.decode("utf-8", "replace").splitlines() if linha.strip()]
+
+    segmento = next((linha for linha in linhas if not linha.startswith("#")), None)
+    if segmento is None:
+        Logger.debug("Media playlist sem segmentos 🧪")
+        return False
+    status, corpo, _ = SESSAO_HTTP.obter(urllib.parse.urljoin(url, segmento), {"Range": "bytes=0-1023"}, limite=1024)
+    if status not in (200, 206) or not corpo:
+        Logger.debug("Segmento respondeu HTTP {} 🧪", status)
+        return False
+    return True
 
-    for tentativa in range(tentativas):
-        for formato in formatos_priorizados:
+def testar_url(url: str, timeout: int = 15, profundo: bool = False) -> bool:
+    """Valida a URL pelo manifesto; com `profundo`, decodifica 5 s com ffmpeg como antes."""
+    if profundo:
+        return testar_url_ffmpeg(url, timeout)
+    try:
+        return testar_manifesto(url)
+    except (http.client.HTTPException, OSError, ValueError) as e:
+        Logger.debug("Teste de URL falhou: {} 🧪", e)
+        return False
+
+HOSTS_YOUTUBE = ("www.youtube.com", "youtube.com", "m.youtube.com")
+
+def checar_ao_vivo(url: str) -> Tuple[Optional[bool], str]:
+    """Diz se o canal está ao vivo olhando só a página, sem passar pelo yt-dlp.
+
+    A página /live de um canal ao vivo tem canonical apontando para um
+    watch?v= com isLiveBroadcast e sem endDate; fora do ar, o canonical é a
+    própria página do canal. Devolve (True/False, título) ou (None, título)
+    quando a página não permite decidir, e aí o canal segue para a extração
+    completa. O título é o og:title limpo ou, sem ele, o fim da URL.
+    """
+    titulo_padrao = url.split('/')[-1]
+    if urllib.parse.urlsplit(url).hostname not in HOSTS_YOUTUBE:
+        return None, titulo_padrao
+    try:
+        # SOCS=CAI pula a tela de consentimento, como o próprio yt-dlp faz
+        status, corpo, final = SESSAO_HTTP.obter(
+            url, {"Cookie": "SOCS=CAI", "Accept-Language": "en-US,en;q=0.8"}, limite=1024 * 1024
+        )
+    except (http.client.HTTPException, OSError) as e:
+        Logger.debug("Pré-checagem falhou: {} 🔎", e)
+        return None, titulo_padrao
+    if status != 200 or urllib.parse.urlsplit(final).hostname not in HOSTS_YOUTUBE:
+        return None, titulo_padrao
+
+    pagina = corpo.decode("utf-8", "replace")
+    canonical = re.search(r'<link rel="canonical" href="([^"]+)"', pagina)
+    titulo = re.search(r'<meta property="og:title" content="([^"]*)"', pagina)
+    titulo = (limpar_titulo(html.unescape(titulo.group(1))) if titulo else "") or titulo_padrao
+    if canonical is None:
+        return None, titulo
+    if "/watch?v=" not in canonical.group(1):
+        return False, titulo
+    if 'itemprop="endDate"' in pagina or '"isUpcoming":true' in pagina:
+        return False, titulo
+    if re.search(r'itemprop="isLiveBroadcast" content="True"', pagina):
+        return True, titulo
+    return None, titulo
+
+FORMATOS_PRIORIZADOS = [
+    "best[height<=1080][acodec!=none][protocol^=m3u8]",
+    "bestvideo[height<=1080]+bestaudio/best[height<=1080]",
+    "best[acodec!=none]",
+    "best"
+]
+
+OPCOES_YTDLP = {
+    "quiet": True,
+    "no_warnings": True,
+    "noprogress": True,
+    "skip_download": True,
+    "noplaylist": True,
+    "geo_bypass": True,
+    "source_address": "0.0.0.0",  # Equivalente ao --force-ipv4
+    "cachedir": False,
+}
+
+class CookiesCompartilhados:
+    """cookies.txt carregado uma única vez num jar compartilhado por todos os workers.
+
+    O jar do http.cookiejar já serializa o acesso com um lock interno, então
+    as várias instâncias de YoutubeDL podem usar o mesmo objeto. Mudanças no
+    arquivo são detectadas pelo mtime (checado no máximo a cada `intervalo`
+    segundos) e `salvar` reescreve apenas as linhas dos cookies alterados.
+    """
+    def __init__(self, caminho: str = "cookies.txt", intervalo: float = 5.0):
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self.jar = YoutubeDLCookieJar(caminho)
+        self.mtime = 0.0
+        self.ultima_checagem = 0.0
+        self.originais: Dict[Tuple[str, str, str], Tuple[str, Optional[int]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _chave(cookie) -> Tuple[str, str, str]:
+        return cookie.domain, cookie.path, cookie.name
+
+    def carregar(self) -> "CookiesCompartilhados":
+        novo = YoutubeDLCookieJar(self.caminho)
+        novo.load(ignore_discard=True, ignore_expires=True)
+        with self._lock:
+            self.mtime = os.path.getmtime(self.caminho)
+            self.ultima_checagem = time.monotonic()
+            # Troca o conteúdo no jar já entregue às instâncias do yt-dlp
+            self.jar.clear()
+            for cookie in novo:
+                self.jar.set_cookie(cookie)
+            self.originais = {self._chave(c): (c.value, c.expires) for c in self.jar}
+        Logger.debug(f"{len(self.originais)} cookie(s) carregado(s) de {self.caminho} 🍪")
+        return self
+
+    def atualizar_se_modificado(self):
+        agora = time.monotonic()
+        if agora - self.ultima_checagem < self.intervalo:
+            return
+        self.ultima_checagem = agora
+        try:
+            if os.path.getmtime(self.caminho) != self.mtime:
+                Logger.debug(f"{self.caminho} modificado, recarregando 🍪")
+                self.carregar()
+        except (OSError, http.cookiejar.LoadError) as e:
+            Logger.aviso(f"Falha ao recarregar cookies: {str(e)} 🍪")
+
+    def salvar(self) -> bool:
+        with self._lock:
+            atuais = {self._chave(c): c for c in self.jar}
+            alterados = {
+                chave: cookie for chave, cookie in atuais.items()
+                if self.originais.get(chave) != (cookie.value, cookie.expires)
+            }
+            if not alterados:
+                return True
             try:
-                Logger.processo(f"Tentativa {tentativa+1}/{tentativas} - Formato: {formato} 🔍 URL: {url}")
-                cmd_info = ["yt-dlp", "--dump-json", "--no-warnings", "--geo-bypass", "--force-ipv4", url]
-                result = subprocess.run(cmd_info, capture_output=True, text=True, check=True, timeout=timeout_base + tentativa * 5)
-                info = json.loads(result.stdout)
-
-                Logger.debug(f"ID da live: {info.get('id')} - Ao vivo: {info.get('is_live')} 🎬")
-                if not info.get('is_live'):
-                    Logger.aviso(f"Live não está ativa no momento: {url} ⏸️")
-                    return None, limpar_titulo(info.get('title', url.split('/')[-1]))
-
-                cmd_url = [
-                    "yt-dlp", "--get-url", "--format", formato, "--no-warnings",
-                    "--geo-bypass", "--force-ipv4", "--no-cache-dir", url
-                ]
-                result_url = subprocess.run(cmd_url, capture_output=True, text=True, check=True, timeout=timeout_base)
-                stream_url = result_url.stdout.strip()
-
-                if not stream_url:
-                    raise ValueError("URL do stream vazia")
-
-                Logger.processo(f"Verificando URL: {stream_url[:50]}... 🔎")
-                if testar_url(stream_url):
-                    titulo = limpar_titulo(info.get('title', url.split('/')[-1]))
-                    Logger.sucesso(f"Stream válido encontrado: {titulo} 🎉")
-                    return stream_url, titulo
-                else:
-                    Logger.aviso(f"URL não reproduzível: {stream_url[:50]}... 🚫")
-
-            except subprocess.CalledProcessError as e:
-                erro_msg = e.stderr.strip()
-                Logger.erro(f"Erro no yt-dlp: {erro_msg[:50]}... 😵")
-                if "This live event will" in erro_msg:
-                    Logger.aviso(f"Live agendada ou encerrada: {url} ⏰")
-                    return None, limpar_titulo(url.split('/')[-1])
-            except subprocess.TimeoutExpired:
-                Logger.erro("Timeout na operação ⏱️")
-            except json.JSONDecodeError as e:
-                Logger.erro(f"Erro ao decodificar JSON: {str(e)} 📜")
-            except Exception as e:
-                Logger.erro(f"Falha crítica: {str(e)} 💥")
-        time.sleep(3)
-    
-    Logger.erro(f"Falha após {tentativas} tentativas para {url} 😢")
-    return None, url.split('/')[-1]
+                with open(self.caminho, "r", encoding="utf-8") as f:
+                    linhas = f.readlines()
+                pendentes = dict(alterados)
+                for i, linha in enumerate(linhas):
+                    campos = linha.rstrip("\n").split("\t")
+                    if len(campos) != 7:
+                        continue
+                    dominio = campos[0].removeprefix("#HttpOnly_")
+                    cookie = alterados.get((dominio, campos[2], campos[5]))
+                    if cookie is not None:
+                        prefixo = "#HttpOnly_" if campos[0].startswith("#HttpOnly_") else ""
+                        linhas[i] = prefixo + self._formatar(cookie)
+                        pendentes.pop(self._chave(cookie), None)
+                linhas.extend(self._formatar(cookie) for cookie in pendentes.values())
+
+                with arquivo_atomico(self.caminho) as f:
+                    f.writelines(linhas)
+                self.mtime = os.path.getmtime(self.caminho)
+                for chave, cookie in alterados.items():
+                    self.originais[chave] = (cookie.value, cookie.expires)
+                Logger.debug(f"{len(alterados)} cookie(s) alterado(s) gravado(s) em {self.caminho} 🍪")
+                return True
+            except OSError as e:
+                Logger.erro(f"Falha ao salvar cookies: {str(e)} 🍪")
+                return False
+
+    @staticmethod
+    def _formatar(cookie) -> str:
+        return "\t".join([
+            cookie.domain,
+            "TRUE" if cookie.domain.startswith(".") else "FALSE",
+            cookie.path,
+            "TRUE" if cookie.secure else "FALSE",
+            str(cookie.expires) if cookie.expires is not None else "",
+            cookie.name,
+            cookie.value if cookie.value is not None else "",
+        ]) + "\n"
+
+class YoutubeDLCompartilhado(yt_dlp.YoutubeDL):
+    """YoutubeDL que usa um jar de cookies recebido pronto em vez de ler o cookiefile."""
+    def __init__(self, params: Dict, jar: Optional[YoutubeDLCookieJar] = None):
+        self.jar = jar
+        super().__init__(params)
+
+    @property
+    def cookiejar(self) -> YoutubeDLCookieJar:
+        return self.jar if self.jar is not None else super().cookiejar
+
+class Resolvedor:
+    """Mantém uma instância de yt_dlp.YoutubeDL por thread de trabalho (e por proxy e timeout).
+
+    YoutubeDL não é thread-safe, mas é caro de criar; cada thread do pool
+    reaproveita a sua instância (e seus seletores de formato) durante toda a execução.
+    O timeout entra na chave porque o yt-dlp o fixa nos handlers HTTP ao criar a
+    instância; como ele cresce por tentativa, são no máximo `tentativas` instâncias por proxy.
+    """
+    _local = threading.local()
+    cookies: Optional[CookiesCompartilhados] = None
+
+    @classmethod
+    def instancia(cls, timeout: int = 20, proxy: str = "") -> yt_dlp.YoutubeDL:
+        instancias = getattr(cls._local, "instancias", None)
+        if instancias is None:
+            instancias = cls._local.instancias = {}
+            cls._local.seletores = {}
+        ydl = instancias.get((proxy, timeout))
+        if ydl is None:
+            # proxy "" desliga inclusive proxies do ambiente: conexão direta
+            ydl = instancias[(proxy, timeout)] = YoutubeDLCompartilhado(
+                {**OPCOES_YTDLP, "socket_timeout": timeout, "proxy": proxy},
+                cls.cookies.jar if cls.cookies is not None else None,
+            )
+        return ydl
+
+    @classmethod
+    def extrair(cls, url: str, timeout: int = 20, proxy: str = "") -> Dict:
+        if cls.cookies is not None:
+            cls.cookies.atualizar_se_modificado()
+        return cls.instancia(timeout, proxy).extract_info(url, download=False)
+
+    @classmethod
+    def selecionar_url(cls, info: Dict, formato: str) -> Optional[str]:
+        seletores = getattr(cls._local, "seletores", None)
+        seletor = seletores.get(formato) if seletores is not None else None
+        if seletor is None:
+            # O seletor só depende das opções: qualquer instância desta thread serve
+            instancias = getattr(cls._local, "instancias", None)
+            ydl = next(iter(instancias.values())) if instancias else cls.instancia()
+            seletor = cls._local.seletores[formato] = ydl.build_format_selector(formato)
+
+        formatos = info.get("formats") or [info]
+        ctx = {
+            "formats": formatos,
+            "has_merged_format": any("none" not in (f.get("acodec"), f.get("vcodec")) for f in formatos),
+            "incomplete_formats": (all(f.get("vcodec") == "none" for f in formatos)
+                                   or all(f.get("acodec") == "none" for f in formatos)),
+        }
+        for escolhido in seletor(ctx):
+            if escolhido.get("requested_formats"):
+                # Vídeo e áudio separados não cabem numa única entrada de playlist
+                Logger.debug("Formato {} exige mesclagem, ignorado 🧩", formato)
+                continue
+            if escolhido.get("url"):
+                return escolhido["url"]
+        return None
+
+    @classmethod
+    def ranquear_candidatos(cls, info: Dict, formatos: List[str] = FORMATOS_PRIORIZADOS) -> List[Tuple[str, str]]:
+        """Avalia toda a lista de prioridade sobre um único info dict, sem rede.
+
+        Retorna pares (formato, url) na ordem de preferência, sem URLs repetidas.
+        """
+        candidatos = []
+        vistos = set()
+        for formato in formatos:
+            stream_url = cls.selecionar_url(info, formato)
+            if not stream_url:
+                Logger.debug("Nenhum formato compatível com {} 🚫", formato)
+                continue
+            if stream_url not in vistos:
+                vistos.add(stream_url)
+                candidatos.append((formato, stream_url))
+        return candidatos
+
+class PoolProxies:
+    """Pool de saídas (proxys.txt + conexão direta) escolhidas por saúde medida.
+
+    Cada saída acumula latência (média móvel) e taxa de sucesso. `adquirir`
+    devolve a de melhor pontuação, penalizando as que já estão em uso para
+    espalhar os workers; saídas com falhas seguidas ficam em quarentena com
+    backoff exponencial.
+    """
+    DIRETO = ""
+
+    def __init__(self, proxies: List[str], incluir_direto: bool = True,
+                 quarentena_base: float = 30, quarentena_max: float = 1800):
+        saidas = ([self.DIRETO] if incluir_direto else []) + list(dict.fromkeys(proxies))
+        self.saude = {
+            saida: {"latencia": 2.0, "sucessos": 1, "falhas": 1, "seguidas": 0, "em_uso": 0, "quarentena_ate": 0.0}
+            for saida in saidas
+        }
+        self.quarentena_base = quarentena_base
+        self.quarentena_max = quarentena_max
+        self._lock = threading.Lock()
+
+    @classmethod
+    def carregar(cls, caminho: str = "proxys.txt") -> "PoolProxies":
+        with open(caminho, "r", encoding="utf-8") as f:
+            proxies = [linha.strip() for linha in f if linha.strip() and not linha.startswith("#")]
+        pool = cls(proxies)
+        Logger.sucesso(f"{len(pool.saude) - 1} proxy(s) carregado(s) de {caminho} 🛰️")
+        return pool
+
+    def _pontuacao(self, estado: Dict) -> float:
+        taxa = estado["sucessos"] / (estado["sucessos"] + estado["falhas"])
+        return estado["latencia"] / taxa * (1 + estado["em_uso"])
+
+    def adquirir(self) -> str:
+        agora = time.time()
+        with self._lock:
+            saudaveis = [s for s, e in self.saude.items() if e["quarentena_ate"] <= agora]
+            if saudaveis:
+                saida = min(saudaveis, key=lambda s: self._pontuacao(self.saude[s]))
+            else:
+                # Todas em quarentena: usa a que sai primeiro
+                saida = min(self.saude, key=lambda s: self.saude[s]["quarentena_ate"])
+            self.saude[saida]["em_uso"] += 1
+            return saida
+
+    def liberar(self, saida: str, sucesso: bool, latencia: float):
+        with self._lock:
+            estado = self.saude[saida]
+            estado["em_uso"] -= 1
+            if sucesso:
+                estado["sucessos"] += 1
+                estado["seguidas"] = 0
+                estado["latencia"] = 0.7 * estado["latencia"] + 0.3 * latencia
+                return
+            estado["falhas"] += 1
+            estado["seguidas"] += 1
+            if estado["seguidas"] >= 2:
+                espera = min(self.quarentena_base * 2 ** (estado["seguidas"] - 2), self.quarentena_max)
+                estado["quarentena_ate"] = time.time() + espera
+                Logger.debug("Proxy {} em quarentena por {:.0f}s 🚧", saida or "direto", espera)
+
+class PoliticaRetentativa(NamedTuple):
+    tentativas: int      # Máximo de extrações para esta classe de erro
+    base: float          # Espera antes da 2ª tentativa (s)
+    fator: float         # Multiplicador a cada nova tentativa
+    teto: float          # Espera máxima (s)
+
+    def atraso(self, tentativa: int) -> Optional[float]:
+        """Espera antes da próxima tentativa, com jitter; None quando as tentativas acabaram."""
+        if tentativa + 1 >= self.tentativas:
+            return None
+        return min(self.teto, self.base * self.fator ** tentativa) * random.uniform(0.5, 1.0)
+
+# Trechos das mensagens do yt-dlp que identificam cada classe de falha
+CLASSES_DE_ERRO = [
+    ("offline", ("This live event will", "is not currently live", "Premieres in", "has ended",
+                 "not live", "no longer live", "Premiere will begin")),
+    ("bloqueado", ("not available in your country", "geo restrict", "geo-restrict", "confirm your age",
+                   "age-restricted", "inappropriate for some users", "Private video", "members-only",
+                   "Join this channel")),
+    ("limitado", ("HTTP Error 429", "Too Many Requests", "not a bot", "rate-limit", "rate limit")),
+    ("rede", ("timed out", "Unable to connect", "Connection", "ProxyError", "Tunnel", "SSL",
+              "HTTP Error 5", "Temporary failure", "Name or service not known", "Network is unreachable",
+              "Unable to download API page", "HTTP Error 403")),
+]
+
+POLITICAS_RETENTATIVA = {
+    "offline": PoliticaRetentativa(1, 0, 1, 0),
+    "bloqueado": PoliticaRetentativa(1, 0, 1, 0),
+    "limitado": PoliticaRetentativa(4, 30, 2, 300),
+    "rede": PoliticaRetentativa(3, 2, 3, 30),
+    "extrator": PoliticaRetentativa(2, 5, 1, 5),
+    "verificacao": PoliticaRetentativa(3, 3, 2, 15),
+}
+
+def classificar_erro(erro_msg: str) -> str:
+    for classe, trechos in CLASSES_DE_ERRO:
+        if any(trecho in erro_msg for trecho in trechos):
+            return classe
+    return "extrator"
+
+def falha_de_rede(classe: str) -> bool:
+    """Classes de erro que dizem respeito à saída usada (proxy/IP), e não ao canal."""
+    return classe in ("limitado", "rede")
+
+def host_do_canal(url: str) -> str:
+    host = urllib.parse.urlsplit(url).hostname or ""
+    return host.removeprefix("www.").removeprefix("m.")
+
+class DisjuntorHosts:
+    """Circuit breaker por host de origem (youtube.com, dailymotion.com...).
+
+    Falhas de limitação/rede seguidas abrem o circuito do host: ninguém fala
+    com ele até o fim do resfriamento, que dobra a cada reabertura. Depois
+    disso uma única requisição de teste passa (meio-aberto); se der certo o
+    circuito fecha, se falhar reabre. Só contam as respostas pela conexão
+    direta: falhas por um proxy dizem respeito ao proxy, e o PoolProxies já
+    põe em quarentena os que falham.
+    """
+    def __init__(self, limite: int = 5, resfriamento: float = 60, resfriamento_max: float = 900):
+        self.limite = limite
+        self.resfriamento = resfriamento
+        self.resfriamento_max = resfriamento_max
+        self.hosts: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def _estado(self, host: str) -> Dict:
+        return self.hosts.setdefault(host, {"falhas": 0, "aberto_ate": 0.0, "aberturas": 0, "testando": False})
+
+    def espera(self, host: str) -> float:
+        """Segundos até o host aceitar requisições; 0 libera (e reserva o teste se meio-aberto)."""
+        with self._lock:
+            estado = self._estado(host)
+            restante = estado["aberto_ate"] - time.time()
+            if restante > 0:
+                return restante
+            if estado["aberturas"] and estado["falhas"] >= self.limite:
+                if estado["testando"]:
+                    return 1.0
+                estado["testando"] = True
+            return 0.0
+
+    def registrar(self, host: str, classe: str, saida: str = PoolProxies.DIRETO):
+        with self._lock:
+            estado = self._estado(host)
+            estado["testando"] = False
+            if saida != PoolProxies.DIRETO:
+                return
+            if not falha_de_rede(classe):
+                estado["falhas"] = 0
+                estado["aberturas"] = 0
+                return
+            estado["falhas"] += 1
+            if estado["falhas"] >= self.limite:
+                duracao = min(self.resfriamento * 2 ** estado["aberturas"], self.resfriamento_max)
+                estado["aberto_ate"] = time.time() + duracao
+                estado["aberturas"] += 1
+                METRICAS.contar("circuitos_abertos")
+                Logger.aviso("Circuito aberto para {} por {:.0f}s 🔌", host, duracao)
+
+def resolver_canal(url: str, tentativa: int = 0, timeout_base: int = 20,
+                   proxies: Optional[PoolProxies] = None) -> Dict:
+    """Faz uma tentativa de extração e devolve titulo, candidatos, classe, saida e se o resultado é definitivo.
+
+    A classe ("ok" ou uma de CLASSES_DE_ERRO/"extrator") escolhe a política de
+    retentativa; resultados definitivos (offline, bloqueado) não são tentados de novo.
+    """
+    titulo_padrao = url.split('/')[-1]
+    saida = proxies.adquirir() if proxies is not None else PoolProxies.DIRETO
+    inicio = time.monotonic()
+    saida_ok = False
+    try:
+        Logger.processo("Tentativa {} 🔍 URL: {}{}", tentativa + 1, url, f" via {saida}" if saida else "")
+        METRICAS.contar("tentativas", url)
+        with METRICAS.medir("extracao", url):
+            info = Resolvedor.extrair(url, timeout_base + tentativa * 5, saida)
+        saida_ok = True
+
+        Logger.debug("ID da live: {} - Ao vivo: {} 🎬", info.get("id"), info.get("is_live"))
+        titulo = limpar_titulo(info.get('title', titulo_padrao))
+        if not info.get('is_live'):
+            Logger.aviso("Live não está ativa no momento: {} ⏸️", url)
+            return {"titulo": titulo, "candidatos": [], "definitivo": True, "classe": "offline", "saida": saida}
+
+        with METRICAS.medir("resolucao_url", url):
+            candidatos = Resolvedor.ranquear_candidatos(info)
+        Logger.debug("{} URL(s) candidata(s) para {} 🧾", len(candidatos), url)
+        # Master playlist da qual o yt-dlp tirou os formatos HLS, quando houver
+        manifesto = next((f["manifest_url"] for f in info.get("formats") or [] if f.get("manifest_url")), None)
+        return {"titulo": titulo, "candidatos": candidatos, "definitivo": False, "classe": "ok",
+                "manifesto": manifesto, "saida": saida}
+
+    except yt_dlp.utils.DownloadError as e:
+        erro_msg = str(e).strip()
+        classe = classificar_erro(erro_msg)
+        saida_ok = not falha_de_rede(classe)
+        if "timed out" in erro_msg:
+            METRICAS.contar("timeouts", url)
+        METRICAS.contar(f"erros_{classe}", url)
+        Logger.erro("Erro no yt-dlp ({}): {}... 😵", classe, erro_msg[:50])
+        if classe == "offline":
+            Logger.aviso("Live agendada ou encerrada: {} ⏰", url)
+        elif classe == "bloqueado":
+            Logger.aviso("Conteúdo bloqueado (região/idade/privado): {} 🔒", url)
+        if classe in ("offline", "bloqueado"):
+            return {"titulo": limpar_titulo(titulo_padrao), "candidatos": [], "definitivo": True, "classe": classe, "saida": saida}
+    except Exception as e:
+        classe = "extrator"
+        METRICAS.contar("erros_extrator", url)
+        Logger.erro("Falha crítica: {} 💥", e)
+    finally:
+        if proxies is not None:
+            proxies.liberar(saida, saida_ok, time.monotonic() - inicio)
+    return {"titulo": titulo_padrao, "candidatos": [], "definitivo": False, "classe": classe, "saida": saida}
+
+def verificar_candidatos(candidatos: List[Tuple[str, str]], profundo: bool = False,
+                         canal: Optional[str] = None) -> Optional[str]:
+    for formato, stream_url in candidatos:
+        Logger.processo("Verificando [{}]: {}... 🔎", formato, stream_url[:50])
+        METRICAS.contar("formatos_testados", canal)
+        with METRICAS.medir("verificacao", canal):
+            valida = testar_url(stream_url, profundo=profundo)
+        if valida:
+            return stream_url
+        Logger.aviso("URL não reproduzível: {}... 🚫", stream_url[:50])
+    return None
+
+DISJUNTORES = DisjuntorHosts()
+
+def proxima_espera(classe: str, tentativa: int, teto: Optional[int] = None) -> Optional[float]:
+    """Espera até a próxima tentativa segundo a política da classe; None para desistir.
+
+    O número de tentativas é o da classe; `teto` (--tentativas) só pode reduzi-lo.
+    """
+    if teto is not None and tentativa + 1 >= teto:
+        return None
+    return POLITICAS_RETENTATIVA[classe].atraso(tentativa)
+
+class ResultadoCanal(NamedTuple):
+    """Desfecho de `obter_stream_com_audio`; `tentar_em` diz em quantos segundos vale pedir de novo."""
+    url: Optional[str]
+    titulo: str
+    status: str
+    tentar_em: float = 0.0
+
+def obter_stream_com_audio(url: str, tentativas: Optional[int] = None, timeout_base: int = 20,
+                           proxies: Optional[PoolProxies] = None, espera_max: float = 10) -> ResultadoCanal:
+    """Resolve um canal na thread atual, sem nunca bloquear por muito tempo.
+
+    Com o circuito do host aberto desiste na hora, e uma retentativa cuja
+    espera passaria de `espera_max` segundos também encerra a resolução: em
+    ambos os casos `tentar_em` devolve a espera para quem chamou decidir.
+    """
+    host = host_do_canal(url)
+    titulo_padrao = url.split('/')[-1]
+    tentativa = 0
+    while True:
+        espera = DISJUNTORES.espera(host)
+        if espera > 0:
+            Logger.aviso("Circuito aberto para {}, desistindo de {} por ora 🔌", host, url)
+            METRICAS.marcar_status(url, "falha")
+            return ResultadoCanal(None, titulo_padrao, "circuito_aberto", espera)
+        resolucao = resolver_canal(url, tentativa, timeout_base, proxies)
+        DISJUNTORES.registrar(host, resolucao["classe"], resolucao["saida"])
+        if resolucao["definitivo"]:
+            METRICAS.marcar_status(url, resolucao["classe"])
+            return ResultadoCanal(None, resolucao["titulo"], resolucao["classe"])
+
+        stream_url = verificar_candidatos(resolucao["candidatos"], canal=url)
+        if stream_url:
+            Logger.sucesso("Stream válido encontrado: {} 🎉", resolucao["titulo"])
+            METRICAS.marcar_status(url, "ao_vivo")
+            return ResultadoCanal(stream_url, resolucao["titulo"], "ao_vivo")
+
+        classe = "verificacao" if resolucao["classe"] == "ok" else resolucao["classe"]
+        atraso = proxima_espera(classe, tentativa, tentativas)
+        if atraso is None or atraso > espera_max:
+            break
+        time.sleep(atraso)
+        tentativa += 1
+
+    Logger.erro("Falha após {} tentativa(s) para {} 😢", tentativa + 1, url)
+    METRICAS.marcar_status(url, "falha")
+    return ResultadoCanal(None, titulo_padrao, "falha", atraso or 0.0)
+
+def extrair_expiracao(stream_url: str) -> Optional[int]:
+    """Lê o timestamp de expiração embutido nas URLs do googlevideo (/expire/<ts>/ ou ?expire=<ts>)."""
+    m = re.search(r'[/?&]expire[/=](\d+)', stream_url)
+    return int(m.group(1)) if m else None
+
+class CacheStreams:
+    """Cache em disco das URLs resolvidas, indexado pela URL original do canal.
+
+    Com `caminho=None` o cache vive só na memória e nunca lê nem grava disco.
+
+    Uma entrada só é usada enquanto faltar mais que `margem` segundos para a
+    URL expirar; perto disso o canal volta a ser resolvido pelo yt-dlp.
+    URLs sem expiração conhecida valem por `ttl_padrao` segundos.
+    Canais vistos fora do ar ficam registrados sem URL por `ttl_offline`
+    segundos, para não serem checados de novo a cada rodada.
+    """
+    def __init__(self, caminho: Optional[str] = "cache/streams.json", margem: int = 900,
+                 ttl_padrao: int = 3600, max_idade: int = 86400, max_entradas: int = 20000,
+                 ttl_offline: int = 300):
+        self.caminho = caminho
+        self.margem = margem
+        self.ttl_padrao = ttl_padrao
+        self.ttl_offline = ttl_offline
+        self.max_idade = max_idade
+        self.max_entradas = max_entradas
+        self.entradas: Dict[str, Dict] = {}
+        self.alterado = False
+        self._lock = threading.Lock()
+
+    def carregar(self) -> "CacheStreams":
+        if self.caminho is None:
+            return self
+        try:
+            with open(self.caminho, "r", encoding="utf-8") as f:
+                self.entradas = json.load(f)
+            Logger.debug(f"Cache carregado: {len(self.entradas)} entrada(s) 🗃️")
+        except FileNotFoundError:
+            self.entradas = {}
+        except (OSError, ValueError) as e:
+            Logger.aviso(f"Cache ilegível, ignorando: {str(e)} 🗃️")
+            self.entradas = {}
+        return self
+
+    def obter(self, original: str) -> Optional[Dict]:
+        with self._lock:
+            entrada = self.entradas.get(original)
+        if entrada and entrada["url"] and entrada["expira"] - self.margem > time.time():
+            return entrada
+        return None
+
+    def esta_offline(self, original: str) -> Optional[Dict]:
+        with self._lock:
+            entrada = self.entradas.get(original)
+        if entrada and not entrada["url"] and entrada["expira"] > time.time():
+            return entrada
+        return None
+
+    def marcar_offline(self, original: str, titulo: str):
+        agora = time.time()
+        with self._lock:
+            self.entradas[original] = {
+                "url": None, "titulo": titulo, "expira": int(agora + self.ttl_offline), "resolvido_em": int(agora)
+            }
+            self.alterado = True
+
+    def guardar(self, original: str, stream_url: str, titulo: str, variantes: Optional[List[Variante]] = None):
+        agora = time.time()
+        expira = extrair_expiracao(stream_url) or int(agora + self.ttl_padrao)
+        with self._lock:
+            self.entradas[original] = {
+                "url": stream_url, "titulo": titulo, "expira": expira, "resolvido_em": int(agora)
+            }
+            if variantes:
+                self.entradas[original]["variantes"] = [variante._asdict() for variante in variantes]
+            self.alterado = True
+
+    def invalidar(self, original: str):
+        with self._lock:
+            if self.entradas.pop(original, None) is not None:
+                self.alterado = True
+
+    def _evictar(self):
+        agora = time.time()
+        vivas = {
+            original: entrada for original, entrada in self.entradas.items()
+            if entrada["expira"] > agora and agora - entrada["resolvido_em"] < self.max_idade
+        }
+        if len(vivas) > self.max_entradas:
+            mais_recentes = sorted(vivas.items(), key=lambda item: item[1]["resolvido_em"], reverse=True)
+            vivas = dict(mais_recentes[:self.max_entradas])
+        if len(vivas) != len(self.entradas):
+            self.alterado = True
+        self.entradas = vivas
+
+    def salvar(self) -> bool:
+        with self._lock:
+            self._evictar()
+            if not self.alterado or self.caminho is None:
+                return True
+            try:
+                os.makedirs(os.path.dirname(self.caminho) or ".", exist_ok=True)
+                with arquivo_atomico(self.caminho) as f:
+                    json.dump(self.entradas, f, ensure_ascii=False)
+                self.alterado = False
+                Logger.debug(f"Cache salvo: {len(self.entradas)} entrada(s) 🗃️")
+                return True
+            except OSError as e:
+                Logger.erro(f"Falha ao salvar cache: {str(e)} 🗃️")
+                return False
+
+class EstadoCanais:
+    """Estado persistente por canal num SQLite (cache/estado.db).
+
+    Guarda a última URL boa e sua expiração, título, quando o canal esteve
+    ao vivo pela última vez, falhas consecutivas e o tempo gasto em cada
+    estágio. Canais fora do ar há mais de `dias_dormente` dias viram
+    dormentes: só são checados a cada `intervalo_dormente` segundos e, entre
+    uma checagem e outra, entram na playlist direto do banco.
+    """
+    ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS canais (
+            original TEXT PRIMARY KEY,
+            titulo TEXT NOT NULL DEFAULT '',
+            logo TEXT NOT NULL DEFAULT '',
+            grupo TEXT NOT NULL DEFAULT '',
+            url TEXT,
+            expira INTEGER,
+            status TEXT,
+            visto_desde REAL NOT NULL,
+            ultima_checagem REAL NOT NULL,
+            ultima_vez_ao_vivo REAL,
+            falhas_consecutivas INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS tempos (
+            original TEXT NOT NULL,
+            estagio TEXT NOT NULL,
+            ultimo REAL NOT NULL,
+            total REAL NOT NULL,
+            amostras INTEGER NOT NULL,
+            PRIMARY KEY (original, estagio)
+        );
+    """
+    GRAVAR_CANAL = """
+        INSERT INTO canais (original, titulo, logo, grupo, url, expira, status, visto_desde,
+                            ultima_checagem, ultima_vez_ao_vivo, falhas_consecutivas)
+        VALUES (:original, :titulo, :logo, :grupo, :url, :expira, :status, :agora, :agora, :ao_vivo_em, :falhou)
+        ON CONFLICT (original) DO UPDATE SET
+            titulo = CASE WHEN excluded.titulo != '' THEN excluded.titulo ELSE canais.titulo END,
+            logo = excluded.logo,
+            grupo = excluded.grupo,
+            url = COALESCE(excluded.url, canais.url),
+            expira = CASE WHEN excluded.url IS NOT NULL THEN excluded.expira ELSE canais.expira END,
+            status = excluded.status,
+            ultima_checagem = excluded.ultima_checagem,
+            ultima_vez_ao_vivo = COALESCE(excluded.ultima_vez_ao_vivo, canais.ultima_vez_ao_vivo),
+            falhas_consecutivas = CASE WHEN excluded.falhas_consecutivas = 0 THEN 0
+                                       ELSE canais.falhas_consecutivas + 1 END
+    """
+    GRAVAR_TEMPO = """
+        INSERT INTO tempos (original, estagio, ultimo, total, amostras) VALUES (?, ?, ?, ?, 1)
+        ON CONFLICT (original, estagio) DO UPDATE SET
+            ultimo = excluded.ultimo, total = tempos.total + excluded.total, amostras = tempos.amostras + 1
+    """
+
+    def __init__(self, caminho: str = "cache/estado.db", dias_dormente: float = 3,
+                 intervalo_dormente: int = 21600):
+        self.dias_dormente = dias_dormente
+        self.intervalo_dormente = intervalo_dormente
+        os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+        self.conexao = sqlite3.connect(caminho)
+        self.conexao.row_factory = sqlite3.Row
+        self.conexao.execute("PRAGMA journal_mode=WAL")
+        self.conexao.execute("PRAGMA synchronous=NORMAL")
+        self.conexao.executescript(self.ESQUEMA)
+
+    def fechar(self):
+        self.conexao.close()
+
+    def obter(self, original: str) -> Optional[sqlite3.Row]:
+        return self.conexao.execute("SELECT * FROM canais WHERE original = ?", (original,)).fetchone()
+
+    def proxima_checagem(self, linha: sqlite3.Row, agora: Optional[float] = None) -> Optional[float]:
+        """Quando um canal dormente deve ser checado de novo; None se ele não está dormente."""
+        agora = agora or time.time()
+        referencia = linha["ultima_vez_ao_vivo"] or linha["visto_desde"]
+        if agora - referencia < self.dias_dormente * 86400:
+            return None
+        return linha["ultima_checagem"] + self.intervalo_dormente
+
+    def planejar(self, canais: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """Separa os canais a processar agora dos dormentes que podem esperar.
+
+        Os que vão ser processados saem ordenados por quem esteve ao vivo
+        mais recentemente; os adiados voltam como resultados prontos do banco.
+        Só as linhas dos canais da configuração são lidas, pela chave primária.
+        """
+        agora = time.time()
+        linhas = {canal["original"]: self.obter(canal["original"]) for canal in canais}
+        processar, adiados = [], []
+        for canal in canais:
+            linha = linhas.get(canal["original"])
+            proxima = self.proxima_checagem(linha, agora) if linha is not None else None
+            if proxima is not None and proxima > agora:
+                adiados.append({
+                    "original": canal["original"], "url": None, "titulo": linha["titulo"],
+                    "logo": canal["logo"], "grupo": canal["grupo"], "status": linha["status"] or "offline",
+                })
+            else:
+                processar.append(canal)
+        def recencia(canal: Dict) -> float:
+            linha = linhas.get(canal["original"])
+            return float("inf") if linha is None else linha["ultima_vez_ao_vivo"] or 0
+        processar.sort(key=recencia, reverse=True)
+        return processar, adiados
+
+    def registrar(self, resultados: List[Dict]) -> List[Dict]:
+        """Grava os resultados de uma rodada e devolve os que mudaram de URL ou título na playlist."""
+        agora = time.time()
+        mudaram = []
+        with self.conexao:
+            for resultado in resultados:
+                anterior = self.obter(resultado["original"])
+                exibida = anterior["url"] if anterior is not None and anterior["status"] == "ao_vivo" else None
+                if anterior is None or (exibida, anterior["titulo"]) != (resultado["url"], resultado["titulo"]):
+                    mudaram.append(resultado)
+                ao_vivo = resultado["url"] is not None
+                self.conexao.execute(self.GRAVAR_CANAL, {
+                    "original": resultado["original"], "titulo": resultado["titulo"] or "",
+                    "logo": resultado["logo"], "grupo": resultado["grupo"], "url": resultado["url"],
+                    "expira": (extrair_expiracao(resultado["url"]) or int(agora + 3600)) if ao_vivo else None,
+                    "status": resultado["status"], "agora": agora, "ao_vivo_em": agora if ao_vivo else None,
+                    "falhou": int(resultado["status"] in ("falha", "bloqueado")),
+                })
+        return mudaram
+
+    def registrar_tempos(self, relatorio: Dict):
+        """Acumula os tempos por estágio de cada canal medidos em `relatorio` (Metricas.relatorio())."""
+        with self.conexao:
+            self.conexao.executemany(self.GRAVAR_TEMPO, [
+                (canal, estagio, duracao, duracao)
+                for canal, dados in relatorio["canais"].items()
+                for estagio, duracao in dados["estagios"].items()
+            ])
 
 def limpar_titulo(titulo: str, manter_info: bool = False) -> str:
     if manter_info:
@@ -151,7 +1232,7 @@ def limpar_titulo(titulo: str, manter_info: bool = False) -> str:
     ).strip()
 
 def criar_estrutura_pastas() -> bool:
-    estrutura = {"Hhshs": ["TV-FIX.m3u"], "logs": []}
+    estrutura = {"Hhshs": ["TV-FIX.m3u"], "logs": [], "cache": []}
     try:
         uso_disco = shutil.disk_usage(".")
         if uso_disco.free < 1024 * 1024:  # Menos de 1MB livre
@@ -170,159 +1251,1083 @@ def criar_estrutura_pastas() -> bool:
         Logger.erro(f"Falha ao criar estrutura: {str(e)} 📁")
         return False
 
-def atualizar_playlist(canais_validos: List[Dict]) -> bool:
+def formatar_bloco(canal: Dict) -> str:
+    return (
+        f"# Canal: {canal['original']}\n"
+        f'#EXTINF:-1 tvg-logo="{canal["logo"]}" group-title="{canal["grupo"]}",{canal["titulo"]}\n'
+        f"{canal['url'] if canal['url'] else 'Live não ativa'}\n"
+    )
+
+class SaidaM3U:
+    """Playlist M3U com os canais que passam em `filtro`; `escolher_url` troca a URL de cada canal."""
+    cabecalho = "#EXTM3U\n"
+    separador = ""
+    rodape = ""
+
+    def __init__(self, caminho: str, filtro: Optional[Callable[[Dict], bool]] = None,
+                 escolher_url: Optional[Callable[[Dict], Optional[str]]] = None):
+        self.caminho = caminho
+        self.filtro = filtro
+        self.escolher_url = escolher_url
+
+    def fixos(self) -> List[str]:
+        """Arquivos gravados mesmo sem nenhum canal (a playlist vazia também é uma saída)."""
+        return [self.caminho]
+
+    def podar(self, proprios: List[str], alheios: List[str]) -> List[str]:
+        """Apaga o que esta saída gravou antes e não gerou agora; devolve os arquivos apagados.
+
+        `proprios` e `alheios` são os caminhos (realpath) gerados nesta
+        rodada por esta saída e pelas demais.
+        """
+        return []
+
+    def destinos(self, canal: Dict) -> Iterator[Tuple[str, str]]:
+        if self.filtro is None or self.filtro(canal):
+            if self.escolher_url is not None:
+                canal = {**canal, "url": self.escolher_url(canal)}
+            yield self.caminho, formatar_bloco(canal)
+
+class SaidaPorGrupo(SaidaM3U):
+    """Uma playlist por group-title, em `pasta/<grupo>.m3u8`.
+
+    Os arquivos gravados ficam listados em `pasta/.grupos.json`; só eles são
+    apagados quando o grupo some, e nada é apagado se outra saída grava na
+    mesma pasta.
+    """
+    MANIFESTO = ".grupos.json"
+
+    def __init__(self, pasta: str = "grupos"):
+        super().__init__(pasta)
+        self.pasta = pasta
+
+    def fixos(self) -> List[str]:
+        return []
+
+    def podar(self, proprios: List[str], alheios: List[str]) -> List[str]:
+        pasta = os.path.realpath(self.pasta)
+        manifesto = os.path.join(self.pasta, self.MANIFESTO)
+        try:
+            with open(manifesto, "r", encoding="utf-8") as f:
+                anteriores = {os.path.join(pasta, nome) for nome in json.load(f)}
+        except (OSError, ValueError):
+            anteriores = set()
+        atuais = {caminho for caminho in proprios if os.path.dirname(caminho) == pasta}
+        apagados = []
+        if any(os.path.dirname(caminho) == pasta for caminho in alheios):
+            Logger.debug("{} tem arquivos de outras saídas, nada será apagado 🗑️", self.pasta)
+            atuais |= {caminho for caminho in anteriores if os.path.exists(caminho)}
+        else:
+            for caminho in sorted(anteriores - atuais):
+                try:
+                    os.remove(caminho)
+                    apagados.append(caminho)
+                except FileNotFoundError:
+                    pass
+        nomes = sorted(os.path.basename(caminho) for caminho in atuais)
+        gravar_se_mudou(manifesto, json.dumps(nomes, ensure_ascii=False).encode("utf-8"))
+        return apagados
+
+    def destinos(self, canal: Dict) -> Iterator[Tuple[str, str]]:
+        nome = re.sub(r"[^\w-]+", "_", canal["grupo"]).strip("_").lower() or "sem_grupo"
+        yield os.path.join(self.pasta, f"{nome}.m3u8"), formatar_bloco(canal)
+
+class SaidaJSON(SaidaM3U):
+    """Índice JSON dos canais, com status, expiração e escada de variantes."""
+    cabecalho = "[\n"
+    separador = ",\n"
+    rodape = "\n]\n"
+
+    def destinos(self, canal: Dict) -> Iterator[Tuple[str, str]]:
+        yield self.caminho, json.dumps({
+            "id": id_do_canal(canal["original"]),
+            "original": canal["original"],
+            "titulo": canal["titulo"],
+            "logo": canal["logo"],
+            "grupo": canal["grupo"],
+            "status": canal.get("status"),
+            "url": canal["url"],
+            "expira": extrair_expiracao(canal["url"]) if canal["url"] else None,
+            "variantes": [variante._asdict() for variante in canal.get("variantes") or []],
+        }, ensure_ascii=False)
+
+class SaidaXMLTV(SaidaM3U):
+    """Lista de canais no formato XMLTV (só os <channel>, sem programação)."""
+    cabecalho = '<?xml version="1.0" encoding="UTF-8"?>\n<tv generator-info-name="push.py">\n'
+    rodape = "</tv>\n"
+
+    def destinos(self, canal: Dict) -> Iterator[Tuple[str, str]]:
+        icone = f"    <icon src={quoteattr(canal['logo'])}/>\n" if canal["logo"] else ""
+        yield self.caminho, (
+            f'  <channel id="{id_do_canal(canal["original"])}">\n'
+            f"    <display-name>{escape(canal['titulo'] or canal['original'])}</display-name>\n"
+            f"{icone}    <url>{escape(canal['original'])}</url>\n"
+            f"  </channel>\n"
+        )
+
+def montar_saidas(args: argparse.Namespace) -> List[SaidaM3U]:
+    """Saídas configuradas na linha de comando; lives.m3u8 sempre faz parte."""
+    saidas = [SaidaM3U("lives.m3u8")]
+    for altura in args.qualidades or []:
+        def escolher_url(canal: Dict, altura: int = altura) -> Optional[str]:
+            variante = escolher_variante(canal.get("variantes") or [], altura)
+            return variante.url if variante and canal["url"] else canal["url"]
+        saidas.append(SaidaM3U(f"lives_{altura}p.m3u8", escolher_url=escolher_url))
+    if args.ao_vivo:
+        saidas.append(SaidaM3U(args.ao_vivo, filtro=lambda canal: bool(canal["url"])))
+    if args.por_grupo:
+        saidas.append(SaidaPorGrupo(args.por_grupo))
+    if args.indice_json:
+        saidas.append(SaidaJSON(args.indice_json))
+    if args.xmltv:
+        saidas.append(SaidaXMLTV(args.xmltv))
+    return saidas
+
+def gravar_se_mudou(caminho: str, conteudo: bytes) -> bool:
+    """Grava `conteudo` só se o hash diferir do arquivo atual; devolve se gravou."""
+    if os.path.exists(caminho) and os.path.getsize(caminho) == len(conteudo):
+        atual = hashlib.sha256()
+        with open(caminho, "rb") as f:
+            for pedaco in iter(lambda: f.read(1 << 20), b""):
+                atual.update(pedaco)
+        if atual.digest() == hashlib.sha256(conteudo).digest():
+            return False
+    os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+    with arquivo_atomico(caminho, "wb") as f:
+        f.write(conteudo)
+    return True
+
+def renderizar_saidas(canais: List[Dict], saidas: List[SaidaM3U]) -> Tuple[int, int]:
+    """Percorre os canais uma única vez alimentando todas as saídas em memória e grava no fim.
+
+    Devolve (gravados, inalterados): arquivos cujo conteúdo não mudou não são
+    tocados, para não gerar escrita em disco nem commit à toa. Arquivos que
+    uma saída gravou antes e deixou de gerar são apagados (`podar`) e contam
+    como gravados.
+    """
+    buffers: Dict[str, Tuple[SaidaM3U, List[str]]] = {}
+    with METRICAS.medir("renderizacao"):
+        for saida in saidas:
+            for caminho in saida.fixos():
+                buffers.setdefault(caminho, (saida, []))
+        for canal in canais:
+            for saida in saidas:
+                for caminho, trecho in saida.destinos(canal):
+                    buffers.setdefault(caminho, (saida, []))[1].append(trecho)
+
+        gravados = 0
+        for caminho, (saida, trechos) in buffers.items():
+            conteudo = saida.cabecalho + saida.separador.join(trechos) + saida.rodape
+            if gravar_se_mudou(caminho, conteudo.encode("utf-8")):
+                gravados += 1
+                Logger.debug("{} gravado 📝", caminho)
+        inalterados = len(buffers) - gravados
+        for saida in saidas:
+            proprios = [os.path.realpath(caminho) for caminho, (dona, _) in buffers.items() if dona is saida]
+            alheios = [os.path.realpath(caminho) for caminho, (dona, _) in buffers.items() if dona is not saida]
+            for caminho in saida.podar(proprios, alheios):
+                gravados += 1
+                Logger.debug("{} removido 🗑️", caminho)
+    return gravados, inalterados
+
+def atualizar_playlist(canais: List[Dict], saidas: Optional[List[SaidaM3U]] = None,
+                       mudaram: Optional[List[Dict]] = None) -> bool:
+    """Renderiza as saídas configuradas e mescla no TV-FIX.m3u os canais que mudaram (todos, sem `mudaram`)."""
     Logger.cabecalho("Atualizando Playlists")
     if not criar_estrutura_pastas():
         return False
-
     try:
-        with open("lives.m3u8", "w", encoding="utf-8") as f:
-            f.write("#EXTM3U\n")
-            for canal in canais_validos:
-                f.write(f"# Canal: {canal['original']}\n")
-                f.write(f'#EXTINF:-1 tvg-logo="{canal["logo"]}" group-title="{canal["grupo"]}",{canal["titulo"]}\n')
-                f.write(f"{canal['url'] if canal['url'] else 'Live não ativa'}\n")
-        Logger.sucesso("Arquivo lives.m3u8 atualizado com sucesso! 📝")
+        gravados, inalterados = renderizar_saidas(canais, saidas or [SaidaM3U("lives.m3u8")])
+        Logger.sucesso(f"{gravados} arquivo(s) atualizado(s), {inalterados} sem mudança 📝")
     except OSError as e:
-        Logger.erro(f"Erro ao escrever lives.m3u8: {str(e)} ⚠️")
+        Logger.erro(f"Erro ao escrever playlists: {str(e)} ⚠️")
         return False
+    alterados = canais if mudaram is None else mudaram
+    return not alterados or atualizar_tv_fix(alterados)
 
-    caminho_fixo = "Hhshs/TV-FIX.m3u"
-    try:
-        if os.path.exists(caminho_fixo):
-            with open(caminho_fixo, "r", encoding="utf-8") as f:
-                linhas = f.readlines()
+PREFIXO_CANAL = "# Canal: "
+
+class BlocoM3U(NamedTuple):
+    """Trecho da playlist: um canal (`# Canal:` + #EXTINF + URL) ou uma linha avulsa (canal None)."""
+    canal: Optional[str]
+    linhas: List[str]
+    offset: int
+
+def ler_blocos_m3u(f: IO[bytes]) -> Iterator[BlocoM3U]:
+    """Parser em streaming: percorre o arquivo (binário) uma linha por vez, sem carregá-lo inteiro.
+
+    O cabeçalho #EXTM3U da primeira linha é consumido; cada bloco traz o
+    offset em bytes onde começa, para ser relido depois com `seek`.
+    """
+    bloco: Optional[BlocoM3U] = None
+    offset = f.tell()
+    bruta = f.readline()
+    if offset == 0 and bruta.startswith(b"#EXTM3U"):
+        offset += len(bruta)
+        bruta = f.readline()
+    while bruta:
+        linha = bruta.decode("utf-8", "replace")
+        if not linha.endswith("\n"):
+            linha += "\n"
+        if linha.startswith(PREFIXO_CANAL):
+            if bloco is not None:
+                yield bloco
+            bloco = BlocoM3U(linha[len(PREFIXO_CANAL):].strip(), [linha], offset)
+        elif bloco is not None and linha.startswith("#") and linha.strip():
+            bloco.linhas.append(linha)
+        elif bloco is not None:
+            bloco.linhas.append(linha)
+            yield bloco
+            bloco = None
         else:
-            linhas = ["#EXTM3U\n"]
-
-        canais_dict = {canal["original"]: canal for canal in canais_validos}
-        canais_existentes = set()
-        linhas_atualizadas = ["#EXTM3U\n"]
-        linhas_restantes = []
-        url_atual = None
-        bloco_atual = []
-
-        for linha in linhas[1:]:
-            if linha.startswith("# Canal: "):
-                if bloco_atual and url_atual:
-                    if url_atual in canais_dict:
-                        linhas_atualizadas.extend(bloco_atual)
+            yield BlocoM3U(None, [linha], offset)
+        offset += len(bruta)
+        bruta = f.readline()
+    if bloco is not None:
+        yield bloco
+
+def indexar_m3u(caminho: str) -> Dict[str, List[int]]:
+    """Índice URL do canal -> offsets dos seus blocos (um canal pode aparecer mais de uma vez)."""
+    indice: Dict[str, List[int]] = {}
+    with open(caminho, "rb") as f:
+        for bloco in ler_blocos_m3u(f):
+            if bloco.canal is not None:
+                indice.setdefault(bloco.canal, []).append(bloco.offset)
+    return indice
+
+def mesclar_m3u(caminho: str, canais_validos: List[Dict]) -> Tuple[int, int]:
+    """Aplica os canais ao arquivo em tempo linear e memória limitada ao índice.
+
+    Canais já existentes têm só a linha da URL trocada e sobem para o topo
+    (na ordem do arquivo), seguidos dos canais novos e do restante intacto.
+    Retorna (atualizados, adicionados).
+    """
+    canais_dict = {canal["original"]: canal for canal in canais_validos}
+    indice = indexar_m3u(caminho) if os.path.exists(caminho) else {}
+    offsets = sorted(o for original in canais_dict for o in indice.get(original, []))
+
+    with arquivo_atomico(caminho) as saida:
+        saida.write("#EXTM3U\n")
+        if offsets:
+            with open(caminho, "rb") as f:
+                for offset in offsets:
+                    f.seek(offset)
+                    bloco = next(ler_blocos_m3u(f))
+                    canal = canais_dict[bloco.canal]
+                    tags = [linha for linha in bloco.linhas[1:] if linha.startswith("#")]
+                    saida.writelines([bloco.linhas[0], *(tags or [formatar_bloco(canal).splitlines(True)[1]])])
+                    saida.write(f"{canal['url'] if canal['url'] else 'Live não ativa'}\n")
+
+        novos = [canal for canal in canais_validos if canal["original"] not in indice]
+        for canal in novos:
+            saida.write(formatar_bloco(canal))
+
+        if os.path.exists(caminho):
+            with open(caminho, "rb") as f:
+                for bloco in ler_blocos_m3u(f):
+                    if bloco.canal not in canais_dict:
+                        saida.writelines(bloco.linhas)
+    return len(offsets), len(novos)
+
+def atualizar_tv_fix(canais_validos: List[Dict], caminho_fixo: str = "Hhshs/TV-FIX.m3u") -> bool:
+    try:
+        with METRICAS.medir("mescla"):
+            atualizados, adicionados = mesclar_m3u(caminho_fixo, canais_validos)
+        Logger.debug(f"{atualizados} bloco(s) atualizado(s), {adicionados} canal(is) adicionado(s) 🔗")
+        Logger.sucesso("Arquivo TV-FIX.m3u atualizado com canais no topo! 📺")
+        return True
+    except OSError as e:
+        Logger.erro(f"Falha ao atualizar TV-FIX.m3u: {str(e)} ⚠️")
+        return False
+
+async def processar_canais(canais: List[Dict], resolvedores: int = 8, verificadores: int = 16,
+                           tentativas: Optional[int] = None, cache: Optional[CacheStreams] = None, profundo: bool = False,
+                           proxies: Optional[PoolProxies] = None,
+                           executor: Optional[ThreadPoolExecutor] = None,
+                           pre_checagem: bool = False, escada: bool = False, checadores: int = 8,
+                           espera_max: float = 120, prazo: Optional[float] = None,
+                           entrada: Optional[asyncio.Queue] = None,
+                           ao_concluir: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    """Pipeline checagem -> resolução -> verificação -> coleta ligado por filas limitadas.
+
+    Cada estágio tem seu próprio número de workers (`checadores` na
+    pré-checagem, `resolvedores` no yt-dlp, `verificadores` nos probes) e o
+    pool criado aqui tem uma thread para cada um; as filas limitadas fazem
+    o produtor esperar quando o estágio seguinte não dá conta (backpressure).
+    O trabalho bloqueante (yt-dlp, probes) roda em `executor`; sem ele, um pool
+    é criado só para esta chamada.
+    Canais com URL ainda válida no cache pulam o yt-dlp e vão direto à verificação.
+    Com `pre_checagem`, a página do canal é consultada antes do yt-dlp e só
+    quem parece ao vivo segue para a extração; canais fora do ar (na página,
+    no yt-dlp ou no cache negativo) terminam ali como offline.
+    Com `escada`, cada canal ao vivo sai com todas as variantes da master
+    playlist em "variantes", lidas uma vez na verificação (ou do cache).
+
+    Retentativas não seguram workers: a falha é classificada, a política da
+    classe define a espera e o canal volta à fila de resolução por uma task
+    própria quando ela termina. Hosts com o circuito aberto são adiados do mesmo jeito,
+    mas só se o circuito fechar em até `espera_max` segundos; senão o canal
+    termina como circuito_aberto. Com `prazo` (segundos desde o início), nenhuma
+    espera que passe dele é agendada: o canal termina na hora como falha.
+
+    Com `entrada`, depois de `canais` o pipeline continua recebendo canais
+    dessa fila até ler um None; com `ao_concluir`, cada resultado é entregue
+    a ela assim que sai, em vez de acumulado na lista devolvida.
+    """
+    loop = asyncio.get_running_loop()
+    limite = time.monotonic() + prazo if prazo is not None else None
+    proprio = executor is None
+    if proprio:
+        executor = ThreadPoolExecutor(max_workers=resolvedores + verificadores + checadores)
+
+    def em_thread(funcao, *args):
+        return loop.run_in_executor(executor, funcao, *args)
+
+    fila_checar: asyncio.Queue = asyncio.Queue(maxsize=checadores * 2)
+    fila_resolver: asyncio.Queue = asyncio.Queue(maxsize=resolvedores * 2)
+    fila_verificar: asyncio.Queue = asyncio.Queue(maxsize=verificadores * 2)
+    fila_escrever: asyncio.Queue = asyncio.Queue(maxsize=verificadores * 2)
+    resultados = []
+    pendentes = 0
+    produzindo = True
+    concluido = asyncio.Event()
+    agendados = set()
+
+    def dentro_do_prazo(atraso: float) -> bool:
+        return limite is None or time.monotonic() + atraso <= limite
+
+    def reagendar(item: Dict, atraso: float):
+        async def reinserir():
+            await asyncio.sleep(atraso)
+            await fila_resolver.put(item)
+        tarefa = asyncio.create_task(reinserir())
+        agendados.add(tarefa)
+        tarefa.add_done_callback(agendados.discard)
+
+    async def finalizar(canal: Dict, stream_url: Optional[str], titulo: str, status: str,
+                        variantes: Optional[List[Variante]] = None):
+        METRICAS.marcar_status(canal["original"], status)
+        await fila_escrever.put({
+            "original": canal["original"],
+            "url": stream_url,
+            "titulo": titulo,
+            "logo": canal["logo"],
+            "grupo": canal["grupo"],
+            "status": status,
+            "variantes": variantes or []
+        })
+
+    def ler_escada(url: str, original: str) -> List[Variante]:
+        with METRICAS.medir("escada", original):
+            return escada_de_variantes(url)
+
+    async def tentar_de_novo(item: Dict, classe: str, titulo: str):
+        atraso = proxima_espera(classe, item["tentativa"], tentativas)
+        if atraso is None or not dentro_do_prazo(atraso):
+            Logger.erro("Falha após {} tentativa(s) para {} 😢", item["tentativa"] + 1, item["canal"]["original"])
+            await finalizar(item["canal"], None, titulo, "falha")
+            return
+        Logger.debug("Nova tentativa ({}) em {:.1f}s: {} ⏲️", classe, atraso, item["canal"]["original"])
+        reagendar({**item, "tentativa": item["tentativa"] + 1, "usar_cache": False}, atraso)
+
+    async def produtor():
+        nonlocal pendentes, produzindo
+        for canal in canais:
+            pendentes += 1
+            await fila_checar.put({"canal": canal, "tentativa": 0, "usar_cache": True})
+        while entrada is not None:
+            canal = await entrada.get()
+            if canal is None:
+                break
+            pendentes += 1
+            await fila_checar.put({"canal": canal, "tentativa": 0, "usar_cache": True})
+        produzindo = False
+        if pendentes == 0:
+            concluido.set()
+
+    def checar(original: str) -> Tuple[Optional[bool], str]:
+        with METRICAS.medir("pre_checagem", original):
+            return checar_ao_vivo(original)
+
+    async def worker_checar():
+        while True:
+            item = await fila_checar.get()
+            canal = item["canal"]
+            try:
+                if cache is not None:
+                    offline = cache.esta_offline(canal["original"])
+                    if offline:
+                        METRICAS.contar("cache_hits", canal["original"])
+                        await finalizar(canal, None, offline["titulo"], "offline")
+                        continue
+                    if cache.obter(canal["original"]):
+                        await fila_resolver.put(item)
+                        continue
+                if pre_checagem:
+                    ao_vivo, titulo = await em_thread(checar, canal["original"])
+                    if ao_vivo is False:
+                        Logger.aviso("Live não está ativa (pré-checagem): {} ⏸️", canal["original"])
+                        if cache is not None:
+                            cache.marcar_offline(canal["original"], titulo)
+                        await finalizar(canal, None, titulo, "offline")
+                        continue
+                    if ao_vivo is None:
+                        METRICAS.contar("pre_checagem_indefinida", canal["original"])
+                await fila_resolver.put(item)
+            except Exception as e:
+                Logger.erro("Erro ao processar {}: {} 😓", canal["original"], e)
+                await finalizar(canal, None, canal["original"].split('/')[-1], "falha")
+            finally:
+                fila_checar.task_done()
+
+    async def worker_resolver():
+        while True:
+            item = await fila_resolver.get()
+            canal = item["canal"]
+            try:
+                em_cache = cache.obter(canal["original"]) if cache is not None and item["usar_cache"] else None
+                if em_cache:
+                    Logger.debug("URL em cache para {} 🗃️", canal["original"])
+                    METRICAS.contar("cache_hits", canal["original"])
+                    resolucao = {"titulo": em_cache["titulo"], "candidatos": [("cache", em_cache["url"])],
+                                 "definitivo": False, "classe": "ok", "cache": True,
+                                 "variantes": [Variante(**v) for v in em_cache.get("variantes", [])] or None}
+                    await fila_verificar.put((item, resolucao))
+                    continue
+
+                host = host_do_canal(canal["original"])
+                espera = DISJUNTORES.espera(host)
+                if espera > 0:
+                    if espera > espera_max or not dentro_do_prazo(espera):
+                        Logger.aviso("Circuito aberto para {}, desistindo de {} 🔌", host, canal["original"])
+                        await finalizar(canal, None, canal["original"].split('/')[-1], "circuito_aberto")
                     else:
-                        linhas_restantes.extend(bloco_atual)
-                url_atual = linha.split("# Canal: ")[1].strip()
-                canais_existentes.add(url_atual)
-                bloco_atual = [linha]
-            elif url_atual and (linha.startswith("http") or linha.startswith("Live não ativa") or linha.startswith("URL não disponível")):
-                if url_atual in canais_dict:
-                    novo_canal = canais_dict[url_atual]
-                    bloco_atual.append(f"{novo_canal['url'] if novo_canal['url'] else 'Live não ativa'}\n")
-                    Logger.debug(f"Link atualizado para {url_atual} 🔗")
+                        reagendar(item, espera)
+                    continue
+                resolucao = await em_thread(
+                    resolver_canal, canal["original"], item["tentativa"], 20, proxies
+                )
+                DISJUNTORES.registrar(host, resolucao["classe"], resolucao["saida"])
+                if resolucao["classe"] == "offline" and cache is not None:
+                    cache.marcar_offline(canal["original"], resolucao["titulo"])
+                if resolucao["definitivo"]:
+                    await finalizar(canal, None, resolucao["titulo"], resolucao["classe"])
+                elif resolucao["candidatos"]:
+                    await fila_verificar.put((item, resolucao))
                 else:
-                    bloco_atual.append(linha)
-                if url_atual in canais_dict:
-                    linhas_atualizadas.extend(bloco_atual)
+                    classe = "extrator" if resolucao["classe"] == "ok" else resolucao["classe"]
+                    await tentar_de_novo(item, classe, resolucao["titulo"])
+            except Exception as e:
+                Logger.erro("Erro ao processar {}: {} 😓", canal["original"], e)
+                await finalizar(canal, None, canal["original"].split('/')[-1], "falha")
+            finally:
+                fila_resolver.task_done()
+
+    async def worker_verificar():
+        while True:
+            item, resolucao = await fila_verificar.get()
+            canal = item["canal"]
+            try:
+                stream_url = await em_thread(
+                    verificar_candidatos, resolucao["candidatos"], profundo, canal["original"]
+                )
+                if stream_url:
+                    Logger.sucesso("Stream válido encontrado: {} 🎉", resolucao["titulo"])
+                    variantes = resolucao.get("variantes")
+                    if escada and variantes is None:
+                        variantes = await em_thread(
+                            ler_escada, resolucao.get("manifesto") or stream_url, canal["original"]
+                        )
+                    if cache is not None and not resolucao.get("cache"):
+                        cache.guardar(canal["original"], stream_url, resolucao["titulo"], variantes)
+                    await finalizar(canal, stream_url, resolucao["titulo"], "ao_vivo", variantes)
+                elif resolucao.get("cache"):
+                    # URL do cache morreu antes de expirar: resolve de verdade, sem gastar tentativa
+                    cache.invalidar(canal["original"])
+                    reagendar({**item, "usar_cache": False}, 0)
                 else:
-                    linhas_restantes.extend(bloco_atual)
-                url_atual = None
-                bloco_atual = []
+                    await tentar_de_novo(item, "verificacao", resolucao["titulo"])
+            except Exception as e:
+                Logger.erro("Erro ao processar {}: {} 😓", canal["original"], e)
+                await finalizar(canal, None, resolucao["titulo"], "falha")
+            finally:
+                fila_verificar.task_done()
+
+    async def worker_escrever():
+        nonlocal pendentes
+        while True:
+            resultado = await fila_escrever.get()
+            try:
+                if ao_concluir is not None:
+                    ao_concluir(resultado)
+                else:
+                    resultados.append(resultado)
+                Logger.separador()
+            finally:
+                fila_escrever.task_done()
+                pendentes -= 1
+                if pendentes == 0 and not produzindo:
+                    concluido.set()
+
+    workers = [asyncio.create_task(worker_checar()) for _ in range(checadores)]
+    workers += [asyncio.create_task(worker_resolver()) for _ in range(resolvedores)]
+    workers += [asyncio.create_task(worker_verificar()) for _ in range(verificadores)]
+    workers.append(asyncio.create_task(worker_escrever()))
+    try:
+        await produtor()
+        await concluido.wait()
+    finally:
+        for tarefa in [*workers, *agendados]:
+            tarefa.cancel()
+        await asyncio.gather(*workers, *agendados, return_exceptions=True)
+        if proprio:
+            executor.shutdown(wait=False)
+    return resultados
+
+class DaemonAtualizacao:
+    """Modo daemon: mantém o estado dos canais em memória e re-resolve cada um antes da URL expirar.
+
+    A agenda é um heap de (quando, canal). Canais ao vivo voltam para a fila
+    em `expire - margem`; offline e com falha são rechecados em intervalos
+    fixos. Um único pipeline (o mesmo do modo normal) fica rodando, e cada
+    canal entra nele assim que vence, sem esperar um lote inteiro terminar:
+    um canal preso em backoff não atrasa a renovação dos outros. Os
+    resultados são reagendados na hora e gravados em disco quando o
+    pipeline esvazia ou a cada `intervalo_gravacao` segundos; as playlists
+    só são regravadas quando alguma URL muda.
+    """
+    intervalo_gravacao = 30
+
+    def __init__(self, canais: List[Dict], args: argparse.Namespace, cache: Optional[CacheStreams] = None,
+                 proxies: Optional[PoolProxies] = None, persistente: Optional[EstadoCanais] = None):
+        self.canais = {canal["original"]: canal for canal in canais}
+        self.args = args
+        self.cache = cache
+        self.proxies = proxies
+        self.persistente = persistente
+        self.saidas = montar_saidas(args)
+        self.estado: Dict[str, Dict] = {}
+        if persistente is not None:
+            processar, adiados = persistente.planejar(canais)
+            self.estado.update((resultado["original"], resultado) for resultado in adiados)
+            self.agenda = [(float(ordem), canal["original"]) for ordem, canal in enumerate(processar)]
+            self.agenda += [(self.proxima_execucao(resultado), resultado["original"]) for resultado in adiados]
+        else:
+            self.agenda = [(0.0, original) for original in self.canais]
+        heapq.heapify(self.agenda)
+        self.executor = ThreadPoolExecutor(
+            max_workers=args.resolvedores + args.verificadores + args.checadores
+        )
+        self.em_andamento = 0
+        self.concluidos: List[Dict] = []
+        self.mudaram: List[Dict] = []
+        self.gravado_em = time.monotonic()
+        self.acordar = asyncio.Event()
+
+    def proxima_execucao(self, resultado: Dict) -> float:
+        agora = time.time()
+        if not resultado["url"]:
+            linha = self.persistente.obter(resultado["original"]) if self.persistente is not None else None
+            dormente = self.persistente.proxima_checagem(linha, agora) if linha is not None else None
+            if dormente is not None:
+                return max(dormente, agora + self.args.intervalo_offline)
+            offline = resultado["status"] in ("offline", "bloqueado")
+            return agora + (self.args.intervalo_offline if offline else self.args.intervalo_falha)
+        expira = extrair_expiracao(resultado["url"])
+        if expira is None:
+            return agora + self.args.intervalo_offline
+        # Nunca antes de um minuto, para uma URL quase vencida não virar um loop apertado
+        return max(agora + 60, expira - self.args.margem)
+
+    def aplicar(self, resultados: List[Dict]) -> List[Dict]:
+        """Atualiza o estado, reagenda os canais e devolve os que mudaram de URL ou título."""
+        mudaram = []
+        for resultado in resultados:
+            anterior = self.estado.get(resultado["original"])
+            self.estado[resultado["original"]] = resultado
+            if anterior is None or (anterior["url"], anterior["titulo"]) != (resultado["url"], resultado["titulo"]):
+                mudaram.append(resultado)
+            heapq.heappush(self.agenda, (self.proxima_execucao(resultado), resultado["original"]))
+        return mudaram
+
+    def regravar_playlists(self, mudaram: List[Dict]):
+        ordenados = [self.estado[original] for original in self.canais if original in self.estado]
+        if atualizar_playlist(ordenados, self.saidas, mudaram):
+            Logger.sucesso(f"{len(mudaram)} canal(is) alterado(s) nas playlists 🔄")
+
+    def fechar(self):
+        if self.concluidos:
+            self.gravar()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def concluir(self, resultado: Dict):
+        """Recebe cada resultado do pipeline: reagenda o canal e guarda para a próxima gravação."""
+        self.em_andamento -= 1
+        self.concluidos.append(resultado)
+        self.mudaram += self.aplicar([resultado])
+        # A agenda ganhou uma entrada nova, que pode vencer antes da espera atual
+        self.acordar.set()
+
+    def gravar(self):
+        if self.persistente is not None:
+            self.persistente.registrar(self.concluidos)
+            self.persistente.registrar_tempos(METRICAS.relatorio())
+        if self.mudaram:
+            self.regravar_playlists(self.mudaram)
+        if self.cache is not None:
+            self.cache.salvar()
+        if Resolvedor.cookies is not None:
+            Resolvedor.cookies.salvar()
+        salvar_metricas(self.args)
+        METRICAS.reiniciar()
+        self.concluidos, self.mudaram = [], []
+        self.gravado_em = time.monotonic()
+
+    async def executar(self):
+        vencidos: asyncio.Queue = asyncio.Queue()
+        pipeline = asyncio.create_task(processar_canais(
+            [],
+            resolvedores=self.args.resolvedores,
+            verificadores=self.args.verificadores,
+            checadores=self.args.checadores,
+            tentativas=self.args.tentativas,
+            cache=self.cache,
+            profundo=self.args.probe_profundo,
+            proxies=self.proxies,
+            executor=self.executor,
+            pre_checagem=not self.args.sem_pre_checagem,
+            escada=bool(self.args.qualidades),
+            espera_max=self.args.espera_max,
+            entrada=vencidos,
+            ao_concluir=self.concluir,
+        ))
+        try:
+            while not pipeline.done():
+                agora = time.time()
+                lote = 0
+                while self.agenda and self.agenda[0][0] <= agora:
+                    vencidos.put_nowait(self.canais[heapq.heappop(self.agenda)[1]])
+                    lote += 1
+                if lote:
+                    self.em_andamento += lote
+                    Logger.cabecalho(f"Atualizando {lote} Canal(is)")
+
+                if self.concluidos and (
+                    self.em_andamento == 0 or time.monotonic() - self.gravado_em >= self.intervalo_gravacao
+                ):
+                    self.gravar()
+
+                espera = min(self.agenda[0][0] - time.time() if self.agenda else 60, 60)
+                if self.concluidos:
+                    espera = min(espera, self.intervalo_gravacao)
+                Logger.debug("Próxima checagem da agenda em {:.0f}s 💤", espera)
+                self.acordar.clear()
+                try:
+                    await asyncio.wait_for(self.acordar.wait(), max(espera, 0))
+                except asyncio.TimeoutError:
+                    pass
+            await pipeline
+        finally:
+            pipeline.cancel()
+            await asyncio.gather(pipeline, return_exceptions=True)
+def id_do_canal(original: str) -> str:
+    """Identificador estável do canal para as URLs /ch/<id>.m3u8."""
+    return hashlib.sha1(original.encode("utf-8")).hexdigest()[:12]
+
+class ResolvedorSobDemanda:
+    """Resolve um canal só quando alguém pede, juntando pedidos simultâneos numa única resolução.
+
+    As resoluções rodam num pool próprio de `trabalhadores` threads de vida
+    longa, e não na thread de cada requisição: assim o YoutubeDL de cada
+    thread é reaproveitado e o número de extrações simultâneas fica limitado.
+    URLs resolvidas ficam no CacheStreams até perto de expirar; canais
+    offline ficam marcados nele por pouco tempo para não martelar o YouTube.
+    O cache vai para o disco no máximo a cada `intervalo_salvar` segundos.
+    Com `pre_checagem`, a página do canal decide antes do yt-dlp se vale extrair.
+    """
+    def __init__(self, cache: CacheStreams, tentativas: Optional[int] = None, pre_checagem: bool = True,
+                 proxies: Optional[PoolProxies] = None, trabalhadores: int = 8, intervalo_salvar: float = 60):
+        self.cache = cache
+        self.tentativas = tentativas
+        self.pre_checagem = pre_checagem
+        self.proxies = proxies
+        self.intervalo_salvar = intervalo_salvar
+        self.executor = ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix="sob-demanda")
+        self.em_andamento: Dict[str, Future] = {}
+        self.salvo_em = time.time()
+        self._lock = threading.Lock()
+
+    def resolver(self, original: str, timeout: float = 120) -> Tuple[Optional[str], float]:
+        """Devolve (url, tentar_em); sem URL, `tentar_em` é o Retry-After sugerido."""
+        em_cache = self.cache.obter(original)
+        if em_cache:
+            METRICAS.contar("cache_hits", original)
+            return em_cache["url"], 0.0
+        if self.cache.esta_offline(original):
+            return None, self.cache.ttl_offline
+        with self._lock:
+            futuro = self.em_andamento.get(original)
+            if futuro is None:
+                futuro = self.em_andamento[original] = self.executor.submit(self._resolver, original)
             else:
-                if bloco_atual and url_atual:
-                    if url_atual in canais_dict:
-                        linhas_atualizadas.extend(bloco_atual)
-                    else:
-                        linhas_restantes.extend(bloco_atual)
-                url_atual = None
-                bloco_atual = []
-                linhas_restantes.append(linha)
-                Logger.debug(f"Linha preservada sem alterações: {linha.strip()} 📌")
-
-        for canal in canais_validos:
-            if canal["original"] not in canais_existentes:
-                linhas_atualizadas.append(f"# Canal: {canal['original']}\n")
-                linhas_atualizadas.append(f'#EXTINF:-1 tvg-logo="{canal["logo"]}" group-title="{canal["grupo"]}",{canal["titulo"]}\n')
-                linhas_atualizadas.append(f"{canal['url'] if canal['url'] else 'Live não ativa'}\n")
-                Logger.debug(f"Canal adicionado: {canal['original']} ➕")
-
-        novas_linhas = linhas_atualizadas + linhas_restantes
-
-        with open(caminho_fixo, "w", encoding="utf-8") as f:
-            f.writelines(novas_linhas)
-        Logger.sucesso("Arquivo TV-FIX.m3u atualizado com canais no topo! 📺")
-        return True
+                METRICAS.contar("pedidos_agrupados", original)
+        return futuro.result(timeout)
+
+    def _resolver(self, original: str) -> Tuple[Optional[str], float]:
+        try:
+            ao_vivo, titulo = checar_ao_vivo(original) if self.pre_checagem else (None, "")
+            if ao_vivo is False:
+                resultado = ResultadoCanal(None, titulo, "offline")
+            else:
+                resultado = obter_stream_com_audio(original, self.tentativas, proxies=self.proxies)
+            if resultado.url:
+                self.cache.guardar(original, resultado.url, resultado.titulo)
+                resposta = (resultado.url, 0.0)
+            elif resultado.tentar_em:
+                # Circuito aberto ou espera longa demais: não é offline, só "agora não".
+                resposta = (None, resultado.tentar_em)
+            else:
+                self.cache.marcar_offline(original, resultado.titulo)
+                resposta = (None, self.cache.ttl_offline)
+            self._salvar_periodicamente()
+            return resposta
+        finally:
+            with self._lock:
+                self.em_andamento.pop(original, None)
+
+    def _salvar_periodicamente(self):
+        with self._lock:
+            if time.time() - self.salvo_em < self.intervalo_salvar:
+                return
+            self.salvo_em = time.time()
+        self.cache.salvar()
+
+    def fechar(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.cache.salvar()
+
+class ManipuladorPlaylists(BaseHTTPRequestHandler):
+    """Rotas: /lives.m3u8, /TV-FIX.m3u e /ch/<id>.m3u8 (302 para a URL resolvida na hora)."""
+    server: "ServidorPlaylists"
+
+    def _base(self) -> str:
+        return f"http://{self.headers.get('Host') or '%s:%d' % self.server.server_address[:2]}"
+
+    def _responder(self, status: int, corpo: bytes = b"", tipo: str = "text/plain; charset=utf-8",
+                   cabecalhos: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(corpo)))
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_GET(self):
+        caminho = urllib.parse.urlsplit(self.path).path
+        if caminho == "/lives.m3u8":
+            self._responder(200, self.server.renderizar_lives(self._base()).encode("utf-8"), TIPO_M3U)
+        elif caminho == "/TV-FIX.m3u":
+            self._responder(200, self.server.renderizar_tv_fix(self._base()).encode("utf-8"), TIPO_M3U)
+        elif caminho.startswith("/ch/") and caminho.endswith(".m3u8"):
+            self._redirecionar(caminho[len("/ch/"):-len(".m3u8")])
+        else:
+            self._responder(404, "Não encontrado\n".encode("utf-8"))
 
+    def _redirecionar(self, id_canal: str):
+        canal = self.server.canais.get(id_canal)
+        if canal is None:
+            self._responder(404, "Canal desconhecido\n".encode("utf-8"))
+            return
+        try:
+            with METRICAS.medir("sob_demanda", canal["original"]):
+                stream_url, tentar_em = self.server.resolvedor.resolver(canal["original"])
+        except Exception as e:
+            Logger.erro("Erro ao resolver {}: {} 💥", canal["original"], e)
+            self._responder(502, "Falha ao resolver o canal\n".encode("utf-8"))
+            return
+        if stream_url:
+            self._responder(302, cabecalhos={"Location": stream_url, "Cache-Control": "no-store"})
+        else:
+            retry = str(max(1, math.ceil(tentar_em)))
+            self._responder(503, "Live não ativa\n".encode("utf-8"), cabecalhos={"Retry-After": retry})
+
+    def log_message(self, formato, *args):
+        if Logger.ouvintes:
+            Logger.debug("HTTP {} {} 🌐", self.address_string(), formato % args)
+
+TIPO_M3U = "application/vnd.apple.mpegurl; charset=utf-8"
+
+class ServidorPlaylists(ThreadingHTTPServer):
+    """Publica as playlists com URLs estáveis por canal, resolvidas só quando alguém assiste."""
+    daemon_threads = True
+
+    def __init__(self, endereco: Tuple[str, int], canais: List[Dict], resolvedor: ResolvedorSobDemanda,
+                 caminho_fixo: str = "Hhshs/TV-FIX.m3u"):
+        super().__init__(endereco, ManipuladorPlaylists)
+        self.resolvedor = resolvedor
+        self.caminho_fixo = caminho_fixo
+        self.lista = canais
+        self.canais = {id_do_canal(canal["original"]): canal for canal in canais}
+        if os.path.exists(caminho_fixo):
+            with open(caminho_fixo, "rb") as f:
+                for bloco in ler_blocos_m3u(f):
+                    if bloco.canal is not None:
+                        self.canais.setdefault(id_do_canal(bloco.canal), {"original": bloco.canal})
+
+    def renderizar_lives(self, base: str) -> str:
+        partes = ["#EXTM3U\n"]
+        for canal in self.lista:
+            conhecido = self.resolvedor.cache.entradas.get(canal["original"]) or {}
+            titulo = canal.get("titulo") or conhecido.get("titulo") or canal["original"]
+            partes.append(formatar_bloco({
+                **canal, "titulo": titulo, "url": f"{base}/ch/{id_do_canal(canal['original'])}.m3u8"
+            }))
+        return "".join(partes)
+
+    def renderizar_tv_fix(self, base: str) -> str:
+        if not os.path.exists(self.caminho_fixo):
+            return "#EXTM3U\n"
+        partes = ["#EXTM3U\n"]
+        with open(self.caminho_fixo, "rb") as f:
+            for bloco in ler_blocos_m3u(f):
+                if bloco.canal is not None and not bloco.linhas[-1].startswith("#"):
+                    partes.extend(bloco.linhas[:-1])
+                    partes.append(f"{base}/ch/{id_do_canal(bloco.canal)}.m3u8\n")
+                else:
+                    partes.extend(bloco.linhas)
+        return "".join(partes)
+
+CANAIS_PADRAO = [
+    {
+        "original": "https://www.youtube.com/@SBTRP/live",
+        "logo": "https://www.sbt.com.br/assets/images/logo-sbt.webp",
+        "grupo": "🌍 TV Aberta"
+    },
+    {
+        "original": "https://www.youtube.com/live/ABVQXgr2LW4",
+        "logo": "https://upload.wikimedia.org/wikipedia/commons/9/98/SBT_logo.svg",
+        "grupo": "🌍 TV Aberta"
+    },
+    {
+        "original": "https://www.youtube.com/@abaleiaisis/live",
+        "logo": "https://i.imgur.com/RUKVrOH.png",
+        "grupo": "🌍 TV Aberta"
+    },
+    {
+        "original": "https://www.youtube.com/@radionovasdepazoficial/live",
+        "logo": "https://yt3.googleusercontent.com/N2qFz5sN9GWmwrQfJtzKcu6d6w-dmHqE3v3AlfUdB8Y0ikyn1XCxTlEcV-oaRLv7ASepJ0sTRAw=s900-c-k-c0x00ffffff-no-rj",
+        "grupo": "🙏 Religioso"
+    }
+]
+
+def carregar_canais(caminho: Optional[str]) -> List[Dict]:
+    """Lê a lista de canais de um JSON (lista de objetos com original, logo e grupo)."""
+    if not caminho:
+        return CANAIS_PADRAO
+    with open(caminho, "r", encoding="utf-8") as f:
+        canais = json.load(f)
+    for canal in canais:
+        canal.setdefault("logo", "")
+        canal.setdefault("grupo", "")
+    return canais
+
+def ler_argumentos(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="YouTube Live Audio Validator")
+    parser.add_argument("--canais", help="Arquivo JSON com a lista de canais (padrão: lista embutida)")
+    parser.add_argument("--resolvedores", type=int, default=8, help="Extrações yt-dlp simultâneas")
+    parser.add_argument("--verificadores", type=int, default=16, help="Verificações de stream simultâneas")
+    parser.add_argument("--checadores", type=int, default=8, help="Pré-checagens de página simultâneas")
+    parser.add_argument("--tentativas", type=int,
+                        help="Teto de tentativas por canal (padrão: o limite de cada classe de erro)")
+    parser.add_argument("--espera-max", type=float, default=120,
+                        help="Maior espera por um circuito aberto antes de desistir do canal (s)")
+    parser.add_argument("--prazo", type=float,
+                        help="Tempo máximo da execução; esperas que passariam dele viram falha (s)")
+    parser.add_argument("--probe-profundo", action="store_true",
+                        help="Valida cada stream decodificando 5 s com ffmpeg em vez de só checar o manifesto")
+    parser.add_argument("--proxies", nargs="?", const="proxys.txt", metavar="ARQUIVO",
+                        help="Distribui as extrações entre os proxies do arquivo (padrão: proxys.txt)")
+    parser.add_argument("--cookies", default="cookies.txt", metavar="ARQUIVO",
+                        help="Arquivo de cookies Netscape usado pelo yt-dlp (padrão: cookies.txt)")
+    parser.add_argument("--sem-cookies", action="store_true", help="Não usa arquivo de cookies")
+    parser.add_argument("--silencioso", action="store_true", help="Sem saída no console (só o relatório)")
+    parser.add_argument("--relatorio", default="logs/relatorio.json", metavar="ARQUIVO",
+                        help="Relatório JSON da execução (padrão: logs/relatorio.json)")
+    parser.add_argument("--prometheus", metavar="ARQUIVO", help="Também grava as métricas no formato do Prometheus")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Fica em execução re-resolvendo cada canal antes da URL expirar")
+    parser.add_argument("--margem", type=int, default=900,
+                        help="Segundos antes da expiração em que a URL é renovada (padrão: 900)")
+    parser.add_argument("--intervalo-offline", type=int, default=600,
+                        help="No modo daemon, intervalo para rechecar canais offline (padrão: 600)")
+    parser.add_argument("--intervalo-falha", type=int, default=300,
+                        help="No modo daemon, intervalo para tentar de novo canais com falha (padrão: 300)")
+    parser.add_argument("--servir", type=int, nargs="?", const=8080, metavar="PORTA",
+                        help="Sobe um servidor HTTP que resolve cada canal só quando pedido (padrão: 8080)")
+    parser.add_argument("--qualidades", type=int, nargs="+", metavar="ALTURA",
+                        help="Também gera lives_<ALTURA>p.m3u8 a partir da escada HLS (ex.: 480 1080)")
+    parser.add_argument("--ao-vivo", nargs="?", const="lives_ao_vivo.m3u8", metavar="ARQUIVO",
+                        help="Também gera uma playlist só com os canais ao vivo (padrão: lives_ao_vivo.m3u8)")
+    parser.add_argument("--por-grupo", nargs="?", const="grupos", metavar="PASTA",
+                        help="Também gera uma playlist por group-title nesta pasta (padrão: grupos)")
+    parser.add_argument("--indice-json", nargs="?", const="canais.json", metavar="ARQUIVO",
+                        help="Também gera um índice JSON dos canais (padrão: canais.json)")
+    parser.add_argument("--xmltv", nargs="?", const="canais.xml", metavar="ARQUIVO",
+                        help="Também gera a lista de canais em XMLTV (padrão: canais.xml)")
+    parser.add_argument("--sem-cache", action="store_true", help="Ignora o cache de URLs resolvidas")
+    parser.add_argument("--sem-estado", action="store_true",
+                        help="Não usa o histórico dos canais em cache/estado.db")
+    parser.add_argument("--dias-dormente", type=float, default=3,
+                        help="Dias offline depois dos quais o canal passa a ser checado raramente (padrão: 3)")
+    parser.add_argument("--intervalo-dormente", type=int, default=21600,
+                        help="Intervalo entre checagens de canais dormentes (padrão: 21600)")
+    parser.add_argument("--sem-pre-checagem", action="store_true",
+                        help="Não consulta a página do canal antes de rodar o yt-dlp")
+    parser.add_argument("--ttl-offline", type=int, default=300,
+                        help="Segundos em que um canal visto offline não é checado de novo (padrão: 300)")
+    return parser.parse_args(argv)
+
+def salvar_metricas(args: argparse.Namespace):
+    try:
+        METRICAS.salvar_json(args.relatorio)
+        if args.prometheus:
+            METRICAS.salvar_prometheus(args.prometheus)
+        Logger.debug(f"Relatório de métricas salvo em {args.relatorio} 📈")
     except OSError as e:
-        Logger.erro(f"Falha ao atualizar TV-FIX.m3u: {str(e)} ⚠️")
-        return False
+        Logger.erro(f"Falha ao salvar métricas: {str(e)} 📈")
 
-def main():
+def main(argv: Optional[List[str]] = None):
+    args = ler_argumentos(argv)
+    Logger.ouvintes = [] if args.silencioso else [RenderizadorConsole()]
     Logger.cabecalho("YouTube Live Audio Validator")
-    if not verificar_dependencias():
+    if not verificar_dependencias(exigir_ffmpeg=args.probe_profundo):
         Logger.erro("Dependências ausentes, encerrando... 😞")
         return
 
-    canais = [
-        {
-            "original": "https://www.youtube.com/@SBTRP/live",
-            "logo": "https://www.sbt.com.br/assets/images/logo-sbt.webp",
-            "grupo": "🌍 TV Aberta"
-        },
-        {
-            "original": "https://www.youtube.com/live/ABVQXgr2LW4",
-            "logo": "https://upload.wikimedia.org/wikipedia/commons/9/98/SBT_logo.svg",
-            "grupo": "🌍 TV Aberta"
-        },
-        {
-            "original": "https://www.youtube.com/@abaleiaisis/live",
-            "logo": "https://i.imgur.com/RUKVrOH.png",
-            "grupo": "🌍 TV Aberta"
-        },
-        {
-            "original": "https://www.youtube.com/@radionovasdepazoficial/live",
-            "logo": "https://yt3.googleusercontent.com/N2qFz5sN9GWmwrQfJtzKcu6d6w-dmHqE3v3AlfUdB8Y0ikyn1XCxTlEcV-oaRLv7ASepJ0sTRAw=s900-c-k-c0x00ffffff-no-rj",
-            "grupo": "🙏 Religioso"
-        }
-    ]
+    try:
+        canais = carregar_canais(args.canais)
+    except (OSError, ValueError) as e:
+        Logger.erro(f"Falha ao carregar lista de canais: {str(e)} 📋")
+        return
 
     Logger.separador()
-    Logger.cabecalho("Processando Canais")
-    resultados = []
-    max_workers = min(len(canais), 5)
+    Logger.cabecalho(f"Processando {len(canais)} Canais")
+    if not criar_estrutura_pastas():
+        return
+
+    cache = None if args.sem_cache else CacheStreams(margem=args.margem, ttl_offline=args.ttl_offline).carregar()
+    if not args.sem_cookies and os.path.exists(args.cookies):
+        try:
+            Resolvedor.cookies = CookiesCompartilhados(args.cookies).carregar()
+        except (OSError, http.cookiejar.LoadError) as e:
+            Logger.aviso(f"Cookies ignorados: {str(e)} 🍪")
+    proxies = None
+    if args.proxies:
+        try:
+            proxies = PoolProxies.carregar(args.proxies)
+        except OSError as e:
+            Logger.aviso(f"Proxies indisponíveis, usando conexão direta: {str(e)} 🛰️")
+
+    if args.servir:
+        Logger.cabecalho("Modo Servidor")
+        resolvedor = ResolvedorSobDemanda(
+            cache or CacheStreams(caminho=None, margem=args.margem, ttl_offline=args.ttl_offline),
+            tentativas=args.tentativas,
+            pre_checagem=not args.sem_pre_checagem,
+            proxies=proxies,
+            trabalhadores=args.resolvedores,
+        )
+        servidor = ServidorPlaylists(("0.0.0.0", args.servir), canais, resolvedor)
+        Logger.sucesso(f"Servindo {len(servidor.canais)} canal(is) em http://0.0.0.0:{args.servir}/lives.m3u8 🌐")
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            Logger.aviso("Servidor interrompido 🛑")
+        finally:
+            servidor.server_close()
+            resolvedor.fechar()
+            if Resolvedor.cookies is not None:
+                Resolvedor.cookies.salvar()
+            salvar_metricas(args)
+        return
+
+    estado = None if args.sem_estado else EstadoCanais(
+        dias_dormente=args.dias_dormente, intervalo_dormente=args.intervalo_dormente
+    )
+
+    if args.daemon:
+        Logger.cabecalho("Modo Daemon")
+        daemon = DaemonAtualizacao(canais, args, cache, proxies, estado)
+        try:
+            asyncio.run(daemon.executar())
+        except KeyboardInterrupt:
+            Logger.aviso("Daemon interrompido 🛑")
+        finally:
+            daemon.fechar()
+            if cache is not None:
+                cache.salvar()
+            if Resolvedor.cookies is not None:
+                Resolvedor.cookies.salvar()
+            if estado is not None:
+                estado.fechar()
+        return
+
+    ordem = {canal["original"]: i for i, canal in enumerate(canais)}
+    adiados = []
+    if estado is not None:
+        canais, adiados = estado.planejar(canais)
+        if adiados:
+            Logger.processo(f"{len(adiados)} canal(is) offline há mais de {args.dias_dormente:g} dia(s) adiado(s) 💤")
 
     try:
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {executor.submit(obter_stream_com_audio, ch["original"]): ch for ch in canais}
-            for future in as_completed(futures):
-                canal = futures[future]
-                try:
-                    url, titulo = future.result()
-                    resultados.append({
-                        "original": canal["original"],
-                        "url": url,
-                        "titulo": titulo,
-                        "logo": canal["logo"],
-                        "grupo": canal["grupo"]
-                    })
-                except Exception as e:
-                    Logger.erro(f"Erro ao processar {canal['original']}: {str(e)} 😓")
-                Logger.separador()
+        resultados = asyncio.run(processar_canais(
+            canais,
+            resolvedores=args.resolvedores,
+            verificadores=args.verificadores,
+            checadores=args.checadores,
+            tentativas=args.tentativas,
+            cache=cache,
+            profundo=args.probe_profundo,
+            proxies=proxies,
+            pre_checagem=not args.sem_pre_checagem,
+            escada=bool(args.qualidades),
+            espera_max=args.espera_max,
+            prazo=args.prazo,
+        ))
     except Exception as e:
         Logger.erro(f"Falha no processamento paralelo: {str(e)} 💥")
         return
+    finally:
+        if cache is not None:
+            cache.salvar()
+        if Resolvedor.cookies is not None:
+            Resolvedor.cookies.salvar()
+
+    mudaram = resultados
+    if estado is not None:
+        mudaram = estado.registrar(resultados)
+        estado.registrar_tempos(METRICAS.relatorio())
+        estado.fechar()
 
-    if resultados:
-        if atualizar_playlist(resultados):
+    # Ordem da configuração, não a de término: a mesma entrada gera o mesmo arquivo
+    todos = sorted(adiados + resultados, key=lambda r: ordem[r["original"]])
+    if todos:
+        if atualizar_playlist(todos, montar_saidas(args), mudaram):
             Logger.sucesso(f"Total de streams processados: {len(resultados)} 📊")
             validos = [r for r in resultados if r['url']]
             Logger.sucesso(f"Streams com URL válida: {len(validos)} 🌐")
-            Logger.cabecalho("Teste os Streams")
-            print(f"  {Estilos.VERDE}🎮 Comando para testar:{Estilos.RESET}")
-            url_teste = next((r['url'] for r in resultados if r['url']), "Nenhuma URL disponível")
-            print(f"  {Estilos.NEGRITO}ffplay -autoexit {url_teste}{Estilos.RESET}")
-            print(f"  {Estilos.NEGRITO}vlc {url_teste}{Estilos.RESET}")
+            if not args.silencioso:
+                Logger.cabecalho("Teste os Streams")
+                print(f"  {Estilos.VERDE}🎮 Comando para testar:{Estilos.RESET}")
+                url_teste = next((r['url'] for r in resultados if r['url']), "Nenhuma URL disponível")
+                print(f"  {Estilos.NEGRITO}ffplay -autoexit {url_teste}{Estilos.RESET}")
+                print(f"  {Estilos.NEGRITO}vlc {url_teste}{Estilos.RESET}")
     else:
         Logger.aviso("Nenhum stream processado 😕")
 
+    salvar_metricas(args)
     Logger.cabecalho("Processo Finalizado")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,23 +1,21 @@
 import subprocess
 import sys
 import os
+import json
+import shutil
+import importlib
 import importlib.metadata
 
-# Lista de bibliotecas Python necessárias para o script principal (compatíveis com Python 3.11)
-# Inclui módulos padrão e externos
+# Pacotes externos necessários para o script principal (compatíveis com Python 3.11).
+# Módulos da biblioteca padrão (subprocess, re, json, ...) sempre acompanham o
+# interpretador e não precisam ser verificados.
 REQUIRED_PACKAGES = [
     "yt-dlp>=2025.02.19",  # Pacote externo para streams do YouTube, versão mais recente até março de 2025
-    "subprocess",          # Padrão: execução de comandos (placeholder, não instalável via pip)
-    "re",                  # Padrão: expressões regulares
-    "time",                # Padrão: manipulação de tempo
-    "os",                  # Padrão: operações de sistema operacional
-    "json",                # Padrão: manipulação de JSON
-    "shutil",              # Padrão: operações de arquivo de alto nível
-    "typing",              # Padrão: anotações de tipo
-    "concurrent.futures",  # Padrão: execução paralela
-    "importlib.metadata",  # Padrão: metadados de pacotes
 ]
 
+# Impressão digital do ambiente já verificado; apague o arquivo para forçar nova verificação
+FINGERPRINT_FILE = os.path.join("cache", "ambiente.json")
+
 # Verifica se estamos usando Python 3.11
 EXPECTED_PYTHON_VERSION = (3, 11)
 
@@ -48,96 +46,111 @@ def check_python_version():
         sys.exit(1)
     print(f"✅ Python {current_version[0]}.{current_version[1]} detectado!")
 
+def package_name(requirement):
+    """Nome da distribuição sem o especificador de versão."""
+    return requirement.split(">")[0].split("=")[0].split("<")[0].strip()
+
+def installed_version(name):
+    """Versão instalada da distribuição, ou None se ela não estiver instalada."""
+    try:
+        return importlib.metadata.version(name)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+def compute_fingerprint():
+    """Interpretador, versões dos pacotes externos e caminho/mtime do ffmpeg."""
+    ffmpeg = shutil.which("ffmpeg")
+    return {
+        "python": sys.executable,
+        "python_version": sys.version,
+        "requirements": REQUIRED_PACKAGES,
+        "packages": {package_name(pkg): installed_version(package_name(pkg)) for pkg in REQUIRED_PACKAGES},
+        "ffmpeg": ffmpeg,
+        "ffmpeg_mtime": os.stat(ffmpeg).st_mtime if ffmpeg else None,
+    }
+
+def load_fingerprint():
+    """Impressão digital salva na última verificação bem-sucedida, se houver."""
+    try:
+        with open(FINGERPRINT_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_fingerprint(fingerprint):
+    """Guarda a impressão digital para as próximas execuções pularem a verificação."""
+    os.makedirs(os.path.dirname(FINGERPRINT_FILE), exist_ok=True)
+    with open(FINGERPRINT_FILE, "w", encoding="utf-8") as f:
+        json.dump(fingerprint, f, indent=2)
+
 def install_python_deps():
-    """Instala/atualiza pacotes Python necessários."""
-    print("🔧 Atualizando pip para Python 3.11...")
-    run_command([sys.executable, "-m", "pip", "install", "--upgrade", "pip"])
-    
-    print("🔧 Verificando e instalando/atualizando pacotes Python...")
-    installed = {pkg.metadata["Name"].lower() for pkg in importlib.metadata.distributions()}
-    # Separa pacotes padrão (não instaláveis) de pacotes externos
-    external_packages = [pkg for pkg in REQUIRED_PACKAGES if not pkg.replace(".", "-") in ["subprocess", "re", "time", "os", "json", "shutil", "typing", "concurrent-futures", "importlib-metadata"]]
-    missing_or_updatable = [pkg for pkg in external_packages if pkg.split(">")[0].lower() not in installed]
-    
-    if missing_or_updatable:
-        print(f"ℹ️ Instalando/atualizando pacotes externos ausentes: {missing_or_updatable}")
-        run_command([sys.executable, "-m", "pip", "install"] + missing_or_updatable)
+    """Instala os pacotes Python ausentes (o pip só é atualizado quando há algo a instalar)."""
+    print("🔧 Verificando pacotes Python...")
+    missing = [pkg for pkg in REQUIRED_PACKAGES if installed_version(package_name(pkg)) is None]
+    if missing:
+        print("🔧 Atualizando pip para Python 3.11...")
+        run_command([sys.executable, "-m", "pip", "install", "--upgrade", "pip"])
+        print(f"ℹ️ Instalando pacotes externos ausentes: {missing}")
+        run_command([sys.executable, "-m", "pip", "install"] + missing)
+        importlib.invalidate_caches()
     else:
         print("✅ Todos os pacotes externos já estão instalados!")
 
-    # Verifica módulos padrão (não instaláveis via pip, apenas confirma presença)
-    standard_modules = [pkg.replace(".", "-") for pkg in REQUIRED_PACKAGES if pkg.replace(".", "-") in ["subprocess", "re", "time", "os", "json", "shutil", "typing", "concurrent-futures", "importlib-metadata"]]
-    for mod in standard_modules:
-        try:
-            __import__(mod.replace("-", "."))
-            print(f"✅ Módulo padrão {mod} presente!")
-        except ImportError:
-            print(f"❌ Erro: Módulo padrão {mod} não encontrado no Python 3.11!")
-            sys.exit(1)
-
 def install_system_deps():
     """Instala dependências do sistema (ffmpeg)."""
     print("🔧 Verificando e instalando dependências do sistema...")
-    try:
-        subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True, check=True)
+    if shutil.which("ffmpeg"):
         print("✅ FFmpeg já instalado!")
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        print("ℹ️ Instalando FFmpeg...")
-        if os.name == "posix" and not os.getenv("TERMUX_VERSION"):
-            run_command(["apt", "update"], sudo=True)
-            run_command(["apt", "install", "-y", "ffmpeg"], sudo=True)
-        elif os.getenv("TERMUX_VERSION"):
-            run_command(["pkg", "install", "-y", "ffmpeg"])
-        else:
-            print("❌ Sistema não suportado para instalação automática de FFmpeg. Instale manualmente!")
-            sys.exit(1)
+        return
+    print("ℹ️ Instalando FFmpeg...")
+    if os.name == "posix" and not os.getenv("TERMUX_VERSION"):
+        run_command(["apt", "update"], sudo=True)
+        run_command(["apt", "install", "-y", "ffmpeg"], sudo=True)
+    elif os.getenv("TERMUX_VERSION"):
+        run_command(["pkg", "install", "-y", "ffmpeg"])
+    else:
+        print("❌ Sistema não suportado para instalação automática de FFmpeg. Instale manualmente!")
+        sys.exit(1)
 
-def verify_installation():
-    """Verifica se todas as bibliotecas e dependências estão instaladas."""
+def verify_installation(fingerprint):
+    """Confere na impressão digital se todos os pacotes e o ffmpeg estão presentes."""
     print("🔍 Verificação final...")
-    installed = {pkg.metadata["Name"].lower() for pkg in importlib.metadata.distributions()}
-    external_packages = [pkg for pkg in REQUIRED_PACKAGES if not pkg.replace(".", "-") in ["subprocess", "re", "time", "os", "json", "shutil", "typing", "concurrent-futures", "importlib-metadata"]]
-    for pkg in external_packages:
-        pkg_name = pkg.split(">")[0].lower()
-        if pkg_name not in installed:
-            print(f"❌ Erro: {pkg_name} não instalado!")
-            sys.exit(1)
-        print(f"✅ {pkg_name} instalado com sucesso!")
-
-    # Verifica módulos padrão
-    standard_modules = [pkg.replace(".", "-") for pkg in REQUIRED_PACKAGES if pkg.replace(".", "-") in ["subprocess", "re", "time", "os", "json", "shutil", "typing", "concurrent-futures", "importlib-metadata"]]
-    for mod in standard_modules:
-        try:
-            __import__(mod.replace("-", "."))
-            print(f"✅ Módulo padrão {mod} confirmado!")
-        except ImportError:
-            print(f"❌ Erro: Módulo padrão {mod} não encontrado!")
+    for name, version in fingerprint["packages"].items():
+        if version is None:
+            print(f"❌ Erro: {name} não instalado!")
             sys.exit(1)
+        print(f"✅ {name} {version} instalado com sucesso!")
 
-    # Verifica FFmpeg
-    try:
-        result = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True, check=True)
-        print(f"✅ FFmpeg instalado: {result.stdout.splitlines()[0]}")
-    except (subprocess.CalledProcessError, FileNotFoundError):
+    if not fingerprint["ffmpeg"]:
         print("❌ Erro: FFmpeg não encontrado!")
         sys.exit(1)
+    result = subprocess.run([fingerprint["ffmpeg"], "-version"], capture_output=True, text=True)
+    print(f"✅ FFmpeg instalado: {result.stdout.splitlines()[0] if result.stdout else fingerprint['ffmpeg']}")
 
-def run_push_py():
-    """Executa push.py com Python 3.11."""
+def run_push_py(argv):
+    """Executa o main() do push.py neste mesmo processo, repassando os argumentos."""
     push_script = "push.py"
     if not os.path.exists(push_script):
         print(f"❌ Erro: {push_script} não encontrado no diretório atual!")
         sys.exit(1)
     print(f"🚀 Executando {push_script} com Python 3.11...")
-    run_command([sys.executable, push_script])
+    sys.path.insert(0, os.getcwd())
+    import push
+    push.main(argv)
 
 def main():
     print("🚀 Iniciando configuração automática para o script principal...")
     check_python_version()
-    install_python_deps()
-    install_system_deps()
-    verify_installation()
-    run_push_py()
+    fingerprint = compute_fingerprint()
+    if fingerprint == load_fingerprint():
+        print("⚡ Ambiente inalterado desde a última verificação, pulando instalação!")
+    else:
+        install_python_deps()
+        install_system_deps()
+        fingerprint = compute_fingerprint()
+        verify_installation(fingerprint)
+        save_fingerprint(fingerprint)
+    run_push_py(sys.argv[1:])
     print("🏁 Configuração e execução concluídas com sucesso! Todos os módulos necessários estão prontos.")
 
 if __name__ == "__main__":
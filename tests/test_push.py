@@ -0,0 +1,544 @@
+import asyncio
+import contextlib
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import push  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def sem_logs(monkeypatch):
+    monkeypatch.setattr(push.Logger, "ouvintes", [])
+
+
+def canal(original, url=None, titulo="Canal"):
+    return {"original": original, "url": url, "titulo": titulo, "logo": "", "grupo": "G", "status": "ao_vivo"}
+
+
+def escrever(caminho, texto):
+    with open(caminho, "w", encoding="utf-8") as f:
+        f.write(texto)
+
+
+def ler(caminho):
+    with open(caminho, encoding="utf-8") as f:
+        return f.read()
+
+
+# --- M3U ---------------------------------------------------------------------
+
+def test_blocos_sem_cabecalho_e_sem_quebra_final(tmp_path):
+    caminho = tmp_path / "tv.m3u"
+    escrever(caminho, "# Canal: a\n#EXTINF:-1,A\nhttp://velha\n#EXTINF:-1,Fixo\nhttp://fixo")
+    with open(caminho, "rb") as f:
+        blocos = list(push.ler_blocos_m3u(f))
+    assert [b.canal for b in blocos] == ["a", None, None]
+    assert blocos[0].linhas == ["# Canal: a\n", "#EXTINF:-1,A\n", "http://velha\n"]
+    assert blocos[-1].linhas == ["http://fixo\n"]
+
+
+def test_offsets_apontam_para_o_inicio_do_bloco(tmp_path):
+    caminho = tmp_path / "tv.m3u"
+    escrever(caminho, "#EXTM3U\n# Canal: a\n#EXTINF:-1,A\nhttp://a\n# Canal: b\n#EXTINF:-1,B\nhttp://b\n")
+    indice = push.indexar_m3u(str(caminho))
+    with open(caminho, "rb") as f:
+        for original, offsets in indice.items():
+            f.seek(offsets[0])
+            assert next(push.ler_blocos_m3u(f)).canal == original
+
+
+def test_mescla_troca_url_de_blocos_duplicados(tmp_path):
+    caminho = tmp_path / "tv.m3u"
+    escrever(caminho, (
+        "#EXTM3U\n#EXTINF:-1,Fixo\nhttp://fixo\n"
+        "# Canal: a\n#EXTINF:-1 group-title=\"X\",A\nhttp://velha1\n"
+        "# Canal: a\n#EXTINF:-1,A de novo\nhttp://velha2\n"
+    ))
+    atualizados, adicionados = push.mesclar_m3u(str(caminho), [canal("a", "http://nova")])
+    assert (atualizados, adicionados) == (2, 0)
+    assert ler(caminho) == (
+        "#EXTM3U\n"
+        "# Canal: a\n#EXTINF:-1 group-title=\"X\",A\nhttp://nova\n"
+        "# Canal: a\n#EXTINF:-1,A de novo\nhttp://nova\n"
+        "#EXTINF:-1,Fixo\nhttp://fixo\n"
+    )
+
+
+def test_mescla_sem_cabecalho_sem_quebra_final_e_canal_novo(tmp_path):
+    caminho = tmp_path / "tv.m3u"
+    escrever(caminho, "#EXTINF:-1,Fixo\nhttp://fixo")
+    assert push.mesclar_m3u(str(caminho), [canal("b", None, "B")]) == (0, 1)
+    assert ler(caminho) == (
+        "#EXTM3U\n"
+        "# Canal: b\n#EXTINF:-1 tvg-logo=\"\" group-title=\"G\",B\nLive não ativa\n"
+        "#EXTINF:-1,Fixo\nhttp://fixo\n"
+    )
+
+
+def test_mescla_e_idempotente(tmp_path):
+    caminho = tmp_path / "tv.m3u"
+    escrever(caminho, "#EXTM3U\n#EXTINF:-1,Fixo\nhttp://fixo\n# Canal: a\n#EXTINF:-1,A\nhttp://velha\n")
+    canais = [canal("a", "http://nova"), canal("b", "http://b")]
+    push.mesclar_m3u(str(caminho), canais)
+    primeira = ler(caminho)
+    assert push.mesclar_m3u(str(caminho), canais) == (2, 0)
+    assert ler(caminho) == primeira
+
+
+# --- Variantes HLS -------------------------------------------------------------
+
+def test_ler_variantes():
+    master = (
+        "#EXTM3U\n"
+        '#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aud",NAME="pt",URI="a.m3u8"\n'
+        '#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=854x480,CODECS="avc1.4d401e,mp4a.40.2"\n'
+        "480.m3u8\n"
+        '#EXT-X-STREAM-INF:BANDWIDTH=4500000,RESOLUTION=1920x1080,CODECS="avc1.640028",AUDIO="aud"\n'
+        "https://outro/1080.m3u8\n"
+        '#EXT-X-STREAM-INF:BANDWIDTH=300000,RESOLUTION=256x144,CODECS="avc1.4d400c"\n'
+        "144.m3u8\n"
+    )
+    variantes = push.ler_variantes(master, "https://host/pasta/master.m3u8")
+    assert [(v.url, v.largura, v.altura, v.banda, v.audio) for v in variantes] == [
+        ("https://host/pasta/480.m3u8", 854, 480, 800000, True),
+        ("https://outro/1080.m3u8", 1920, 1080, 4500000, True),
+        ("https://host/pasta/144.m3u8", 256, 144, 300000, False),
+    ]
+    assert push.escolher_variante(variantes, 720).altura == 480
+    assert push.escolher_variante(variantes, 1080).altura == 1080
+    assert push.escolher_variante(variantes, 100).altura == 480
+
+
+def test_ler_variantes_de_media_playlist():
+    assert push.ler_variantes("#EXTM3U\n#EXTINF:2.0,\nseg0.ts\n", "https://h/m.m3u8") == []
+
+
+# --- Classificação de erros ---------------------------------------------------------
+
+@pytest.mark.parametrize("mensagem, classe", [
+    ("ERROR: [youtube] x: This live event will begin in 3 hours.", "offline"),
+    ("ERROR: [youtube] x: Video unavailable. This video is not available in your country", "bloqueado"),
+    ("ERROR: [youtube] x: Sign in to confirm you're not a bot", "limitado"),
+    ("ERROR: Unable to download webpage: HTTP Error 429: Too Many Requests", "limitado"),
+    ("ERROR: Unable to download webpage: <urlopen error timed out>", "rede"),
+    ("ERROR: [youtube] x: Requested format is not available", "extrator"),
+])
+def test_classificar_erro(mensagem, classe):
+    assert push.classificar_erro(mensagem) == classe
+
+
+# --- Cookies --------------------------------------------------------------------
+
+def test_cookies_salvar_reescreve_so_as_linhas_alteradas(tmp_path):
+    caminho = tmp_path / "cookies.txt"
+    original = (
+        "# Netscape HTTP Cookie File\n"
+        "# comentário mantido\n"
+        ".youtube.com\tTRUE\t/\tTRUE\t1999999999\tPREF\tf6=40000000\n"
+        "#HttpOnly_.youtube.com\tTRUE\t/\tTRUE\t1999999999\tLOGIN\tvelho\n"
+    )
+    escrever(caminho, original)
+    cookies = push.CookiesCompartilhados(str(caminho)).carregar()
+    assert cookies.salvar()
+    assert ler(caminho) == original
+
+    for cookie in cookies.jar:
+        if cookie.name == "LOGIN":
+            cookie.value = "novo"
+    assert cookies.salvar()
+    assert ler(caminho) == original.replace("LOGIN\tvelho", "LOGIN\tnovo")
+
+
+def test_cookies_recarregados_no_mesmo_jar_do_yt_dlp(tmp_path, monkeypatch):
+    caminho = tmp_path / "cookies.txt"
+    linha = ".youtube.com\tTRUE\t/\tTRUE\t1999999999\t{}\t{}\n"
+    escrever(caminho, "# Netscape HTTP Cookie File\n" + linha.format("PREF", "a"))
+    cookies = push.CookiesCompartilhados(str(caminho)).carregar()
+    monkeypatch.setattr(push.Resolvedor, "cookies", cookies)
+    monkeypatch.setattr(push.Resolvedor, "_local", threading.local())
+    ydl = push.Resolvedor.instancia()
+    assert ydl.cookiejar is cookies.jar
+
+    escrever(caminho, "# Netscape HTTP Cookie File\n" + linha.format("SID", "b"))
+    cookies.carregar()
+    assert ydl.cookiejar is cookies.jar
+    assert [(c.name, c.value) for c in ydl.cookiejar] == [("SID", "b")]
+
+
+# --- Estado persistente --------------------------------------------------------
+
+def test_estado_upsert(tmp_path):
+    estado = push.EstadoCanais(str(tmp_path / "estado.db"))
+    url = "https://h/expire/1999999999/index.m3u8"
+
+    assert len(estado.registrar([{**canal("a", url, "A"), "status": "ao_vivo"}])) == 1
+    linha = estado.obter("a")
+    assert (linha["url"], linha["expira"], linha["falhas_consecutivas"]) == (url, 1999999999, 0)
+    ao_vivo_em = linha["ultima_vez_ao_vivo"]
+
+    estado.registrar([{**canal("a", None, ""), "status": "falha"}])
+    estado.registrar([{**canal("a", None, ""), "status": "falha"}])
+    linha = estado.obter("a")
+    assert linha["status"] == "falha"
+    assert linha["falhas_consecutivas"] == 2
+    assert (linha["url"], linha["titulo"], linha["ultima_vez_ao_vivo"]) == (url, "A", ao_vivo_em)
+
+    assert estado.registrar([{**canal("a", None, "A"), "status": "offline"}]) == []
+    assert estado.obter("a")["falhas_consecutivas"] == 0
+    estado.fechar()
+
+
+def test_tentativas_seguem_a_politica_da_classe():
+    assert push.proxima_espera("limitado", 2) is not None
+    assert push.proxima_espera("limitado", 3) is None
+    assert push.proxima_espera("rede", 2) is None
+    assert push.proxima_espera("offline", 0) is None
+    assert push.proxima_espera("limitado", 1, teto=2) is None
+
+
+@pytest.mark.parametrize("cabecalho, titulo", [
+    ('<meta property="og:title" content="Rock &amp; Roll AO VIVO">', "Rock & Roll"),
+    ("", "live"),
+])
+def test_pre_checagem_limpa_o_titulo(monkeypatch, cabecalho, titulo):
+    pagina = f'<link rel="canonical" href="https://www.youtube.com/channel/x">{cabecalho}'.encode()
+    url = "https://www.youtube.com/@x/live"
+    monkeypatch.setattr(push.SESSAO_HTTP, "obter", lambda *args, **kwargs: (200, pagina, url))
+    assert push.checar_ao_vivo(url) == (False, titulo)
+
+
+def test_saida_por_grupo_apaga_grupos_que_sumiram(tmp_path):
+    pasta = tmp_path / "grupos"
+    pasta.mkdir()
+    escrever(pasta / "minha_lista.m3u8", "#EXTM3U\n")
+    canal = {"original": "https://www.youtube.com/@a/live", "titulo": "A", "logo": "", "url": None}
+    saidas = [push.SaidaPorGrupo(str(pasta))]
+    push.renderizar_saidas([{**canal, "grupo": "Notícias"}, {**canal, "grupo": "Esportes"}], saidas)
+    assert sorted(os.listdir(pasta)) == [".grupos.json", "esportes.m3u8", "minha_lista.m3u8", "notícias.m3u8"]
+
+    assert push.renderizar_saidas([{**canal, "grupo": "Esportes"}], saidas) == (1, 1)
+    assert sorted(os.listdir(pasta)) == [".grupos.json", "esportes.m3u8", "minha_lista.m3u8"]
+
+
+def test_saida_por_grupo_na_pasta_de_outras_saidas_nao_apaga_nada(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    escrever(tmp_path / "minha_lista.m3u8", "#EXTM3U\n")
+    canal = {"original": "https://www.youtube.com/@a/live", "titulo": "A", "logo": "", "url": None}
+    saidas = [push.SaidaM3U("lives.m3u8"), push.SaidaPorGrupo(".")]
+    push.renderizar_saidas([{**canal, "grupo": "News"}, {**canal, "grupo": "Old"}], saidas)
+    push.renderizar_saidas([{**canal, "grupo": "News"}], saidas)
+    assert sorted(os.listdir(tmp_path)) == [
+        ".grupos.json", "lives.m3u8", "minha_lista.m3u8", "news.m3u8", "old.m3u8"
+    ]
+
+
+# --- Pipeline ------------------------------------------------------------------
+
+def canal_config(original):
+    return {"original": original, "logo": "", "grupo": "G"}
+
+
+def test_pipeline_desiste_de_circuito_aberto_longo(monkeypatch):
+    disjuntores = push.DisjuntorHosts(limite=1, resfriamento=900)
+    disjuntores.registrar("youtube.com", "limitado")
+    monkeypatch.setattr(push, "DISJUNTORES", disjuntores)
+    monkeypatch.setattr(push, "resolver_canal", lambda *args: pytest.fail("não deveria extrair"))
+    canais = [canal_config("https://www.youtube.com/@a/live")]
+    resultados = asyncio.run(push.processar_canais(canais, espera_max=60))
+    assert [r["status"] for r in resultados] == ["circuito_aberto"]
+
+
+def test_pipeline_nao_agenda_retentativa_alem_do_prazo(monkeypatch):
+    monkeypatch.setattr(push, "DISJUNTORES", push.DisjuntorHosts())
+    chamadas = []
+
+    def resolver_canal(url, tentativa, *args):
+        chamadas.append(tentativa)
+        return {"titulo": "A", "candidatos": [], "definitivo": False, "classe": "limitado", "saida": ""}
+    monkeypatch.setattr(push, "resolver_canal", resolver_canal)
+    canais = [canal_config("https://www.youtube.com/@a/live")]
+    resultados = asyncio.run(push.processar_canais(canais, prazo=10))
+    assert [r["status"] for r in resultados] == ["falha"]
+    assert chamadas == [0]
+
+
+def resolucao_ok(url, titulo="T"):
+    return {"titulo": titulo, "candidatos": [("best", url)], "definitivo": False, "classe": "ok", "saida": ""}
+
+
+def test_pipeline_invalida_url_morta_do_cache_sem_gastar_tentativa(tmp_path, monkeypatch):
+    monkeypatch.setattr(push, "DISJUNTORES", push.DisjuntorHosts())
+    original = "https://www.youtube.com/@a/live"
+    cache = push.CacheStreams(str(tmp_path / "streams.json"))
+    cache.guardar(original, "https://h/morta.m3u8", "A")
+    tentativas = []
+
+    def resolver_canal(url, tentativa, *args):
+        tentativas.append(tentativa)
+        return resolucao_ok("https://h/nova.m3u8", "A")
+    monkeypatch.setattr(push, "resolver_canal", resolver_canal)
+    monkeypatch.setattr(push, "verificar_candidatos",
+                        lambda candidatos, *args: next((u for _, u in candidatos if "morta" not in u), None))
+
+    resultados = asyncio.run(push.processar_canais([canal_config(original)], cache=cache))
+    assert [(r["url"], r["status"]) for r in resultados] == [("https://h/nova.m3u8", "ao_vivo")]
+    assert tentativas == [0]
+    assert cache.obter(original)["url"] == "https://h/nova.m3u8"
+
+
+def test_pipeline_reagenda_falha_de_rede_e_marca_offline(tmp_path, monkeypatch):
+    monkeypatch.setattr(push, "DISJUNTORES", push.DisjuntorHosts())
+    monkeypatch.setitem(push.POLITICAS_RETENTATIVA, "rede", push.PoliticaRetentativa(3, 0.01, 1, 0.01))
+    respostas = {
+        "https://www.youtube.com/@a/live": [
+            {"titulo": "a", "candidatos": [], "definitivo": False, "classe": "rede", "saida": ""},
+            resolucao_ok("https://h/a.m3u8", "A"),
+        ],
+        "https://www.youtube.com/@b/live": [
+            {"titulo": "B", "candidatos": [], "definitivo": True, "classe": "offline", "saida": ""},
+        ],
+    }
+    monkeypatch.setattr(push, "resolver_canal", lambda url, *args: respostas[url].pop(0))
+    monkeypatch.setattr(push, "verificar_candidatos", lambda candidatos, *args: candidatos[0][1])
+    cache = push.CacheStreams(str(tmp_path / "streams.json"))
+
+    canais = [canal_config(original) for original in respostas]
+    resultados = asyncio.run(push.processar_canais(canais, cache=cache))
+    assert sorted((r["original"], r["status"]) for r in resultados) == [
+        ("https://www.youtube.com/@a/live", "ao_vivo"), ("https://www.youtube.com/@b/live", "offline"),
+    ]
+    assert all(not pendentes for pendentes in respostas.values())
+    assert cache.esta_offline("https://www.youtube.com/@b/live")["titulo"] == "B"
+
+
+# --- Circuit breaker -------------------------------------------------------------
+
+def test_disjuntor_meio_aberto(monkeypatch):
+    agora = [1000.0]
+    monkeypatch.setattr(push.time, "time", lambda: agora[0])
+    disjuntor = push.DisjuntorHosts(limite=2, resfriamento=60)
+    disjuntor.registrar("youtube.com", "rede")
+    assert disjuntor.espera("youtube.com") == 0
+    disjuntor.registrar("youtube.com", "rede")
+    assert disjuntor.espera("youtube.com") == 60
+
+    agora[0] += 60
+    assert disjuntor.espera("youtube.com") == 0    # a requisição de teste passa
+    assert disjuntor.espera("youtube.com") == 1.0  # as outras esperam o teste
+    disjuntor.registrar("youtube.com", "limitado")
+    assert disjuntor.espera("youtube.com") == 120  # reabre com o dobro
+
+    agora[0] += 120
+    assert disjuntor.espera("youtube.com") == 0
+    disjuntor.registrar("youtube.com", "ok")
+    assert disjuntor.espera("youtube.com") == 0
+    assert disjuntor.espera("youtube.com") == 0
+
+
+def test_disjuntor_ignora_falhas_por_proxy():
+    disjuntor = push.DisjuntorHosts(limite=2)
+    for _ in range(5):
+        disjuntor.registrar("youtube.com", "rede", "http://proxy-morto:8080")
+    assert disjuntor.espera("youtube.com") == 0
+
+
+# --- Daemon ----------------------------------------------------------------------
+
+def args_daemon(tmp_path, *extras):
+    return push.ler_argumentos([
+        "--daemon", "--relatorio", str(tmp_path / "relatorio.json"), "--sem-pre-checagem", *extras
+    ])
+
+
+def test_daemon_proxima_execucao(tmp_path, monkeypatch):
+    monkeypatch.setattr(push.time, "time", lambda: 1000.0)
+    args = args_daemon(tmp_path, "--margem", "900", "--intervalo-offline", "600", "--intervalo-falha", "120")
+    daemon = push.DaemonAtualizacao([], args)
+    daemon.fechar()
+    offline = {"original": "a", "url": None, "status": "offline"}
+    assert daemon.proxima_execucao(offline) == 1600
+    assert daemon.proxima_execucao({**offline, "status": "falha"}) == 1120
+    url = "https://manifest.googlevideo.com/api/manifest/hls_variant/expire/5000/id/x/index.m3u8"
+    assert daemon.proxima_execucao({**offline, "url": url, "status": "ao_vivo"}) == 4100
+    quase_vencida = url.replace("/5000/", "/1500/")
+    assert daemon.proxima_execucao({**offline, "url": quase_vencida, "status": "ao_vivo"}) == 1060
+
+
+def test_daemon_canal_lento_nao_segura_os_outros(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(push, "DISJUNTORES", push.DisjuntorHosts())
+    resolvidos = []
+
+    def resolver_canal(url, *args):
+        if url.endswith("lento"):
+            time.sleep(1.0)
+        resolvidos.append(url)
+        return {"titulo": "T", "candidatos": [], "definitivo": True, "classe": "offline", "saida": ""}
+    monkeypatch.setattr(push, "resolver_canal", resolver_canal)
+    canais = [canal_config("https://www.youtube.com/@lento"), canal_config("https://www.youtube.com/@rapido")]
+    args = args_daemon(tmp_path)
+    args.intervalo_offline = 0.1
+    daemon = push.DaemonAtualizacao(canais, args)
+
+    async def rodar():
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(daemon.executar(), 0.8)
+    asyncio.run(rodar())
+    daemon.fechar()
+    assert "https://www.youtube.com/@lento" not in resolvidos
+    assert resolvidos.count("https://www.youtube.com/@rapido") >= 3
+
+
+# --- Seleção de formatos -----------------------------------------------------------
+
+def formato(id_, altura, protocolo, vcodec="avc1", acodec="mp4a", **extras):
+    return {"format_id": id_, "url": f"https://h/{id_}", "height": altura, "width": altura and altura * 16 // 9,
+            "protocol": protocolo, "vcodec": vcodec, "acodec": acodec, "ext": "mp4", **extras}
+
+
+def test_ranquear_candidatos_prefere_hls_com_audio_ate_1080p():
+    info = {"formats": [
+        formato("hls-480", 480, "m3u8_native", tbr=1000),
+        formato("hls-1080", 1080, "m3u8_native", tbr=5000),
+        formato("hls-1440", 1440, "m3u8_native", tbr=9000),
+        formato("dash-v", 1080, "https", acodec="none", tbr=4000),
+        formato("dash-a", None, "https", vcodec="none", tbr=128),
+    ]}
+    candidatos = push.Resolvedor.ranquear_candidatos(info)
+    assert candidatos[0] == (push.FORMATOS_PRIORIZADOS[0], "https://h/hls-1080")
+    assert len({url for _, url in candidatos}) == len(candidatos)
+    # bestvideo+bestaudio exige mesclagem e é pulado; o fallback é HLS muxado
+    assert "https://h/dash-v" not in [url for _, url in candidatos]
+
+
+def test_selecionar_url_sem_instancia_na_thread():
+    resultado = []
+    thread = threading.Thread(target=lambda: resultado.append(
+        push.Resolvedor.selecionar_url({"formats": [formato("hls", 720, "m3u8")]}, "best[protocol^=m3u8]")
+    ))
+    thread.start()
+    thread.join()
+    assert resultado == ["https://h/hls"]
+
+
+# --- Cache de URLs -----------------------------------------------------------------
+
+def test_cache_respeita_margem_e_expiracao(tmp_path, monkeypatch):
+    agora = [10_000.0]
+    monkeypatch.setattr(push.time, "time", lambda: agora[0])
+    cache = push.CacheStreams(str(tmp_path / "streams.json"), margem=900, ttl_padrao=3600)
+    cache.guardar("a", "https://h/expire/12000/index.m3u8", "A")
+    cache.guardar("b", "https://h/sem-expiracao.m3u8", "B")
+    assert cache.obter("a")["url"] == "https://h/expire/12000/index.m3u8"
+    assert cache.obter("b")["expira"] == 13_600
+
+    agora[0] = 11_100  # faltam 900 s: dentro da margem, o canal volta a ser resolvido
+    assert cache.obter("a") is None
+    assert cache.obter("b") is not None
+
+    cache.marcar_offline("c", "C")
+    assert cache.esta_offline("c")["titulo"] == "C"
+    assert cache.obter("c") is None
+    agora[0] += cache.ttl_offline
+    assert cache.esta_offline("c") is None
+
+
+def test_cache_salvar_descarta_vencidas_e_excedentes(tmp_path, monkeypatch):
+    agora = [10_000.0]
+    monkeypatch.setattr(push.time, "time", lambda: agora[0])
+    caminho = tmp_path / "streams.json"
+    cache = push.CacheStreams(str(caminho), max_entradas=2, max_idade=3600)
+    cache.guardar("vencida", "https://h/expire/9000/index.m3u8", "V")
+    for i, nome in enumerate(["velha", "media", "nova"]):
+        agora[0] = 10_000 + i
+        cache.guardar(nome, "https://h/expire/20000/index.m3u8", nome)
+    assert cache.salvar()
+    assert sorted(push.CacheStreams(str(caminho)).carregar().entradas) == ["media", "nova"]
+
+    agora[0] += 3600
+    cache.salvar()
+    assert push.CacheStreams(str(caminho)).carregar().entradas == {}
+
+
+def test_cache_em_memoria_nao_toca_o_disco(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = push.CacheStreams(caminho=None).carregar()
+    cache.guardar("a", "https://h/x.m3u8", "A")
+    assert cache.salvar()
+    assert os.listdir(tmp_path) == []
+
+
+# --- Proxies -----------------------------------------------------------------------
+
+def test_pool_proxies_prefere_a_saida_mais_saudavel():
+    pool = push.PoolProxies(["http://p1", "http://p2"], incluir_direto=False)
+    saida = pool.adquirir()
+    pool.liberar(saida, True, 0.2)
+    outra = "http://p2" if saida == "http://p1" else "http://p1"
+    assert pool.adquirir() == saida   # mais rápida e com mais sucessos
+    assert pool.adquirir() == outra   # a primeira já está em uso: espalha
+
+
+def test_pool_proxies_quarentena_com_backoff(monkeypatch):
+    agora = [1000.0]
+    monkeypatch.setattr(push.time, "time", lambda: agora[0])
+    pool = push.PoolProxies(["http://morto"], quarentena_base=30)
+    pool.saude[push.PoolProxies.DIRETO]["latencia"] = 50.0  # o direto é pior, mas saudável
+
+    for _ in range(2):
+        assert pool.adquirir() == "http://morto"
+        pool.liberar("http://morto", False, 1.0)
+    assert pool.saude["http://morto"]["quarentena_ate"] == 1030
+    assert pool.adquirir() == push.PoolProxies.DIRETO
+
+    agora[0] = 1030
+    assert pool.adquirir() == "http://morto"
+    pool.liberar("http://morto", False, 1.0)
+    assert pool.saude["http://morto"]["quarentena_ate"] == 1090  # dobrou
+
+
+
+# --- Servidor sob demanda ----------------------------------------------------------
+
+def test_resolvedor_sob_demanda_junta_pedidos_simultaneos(monkeypatch):
+    chamadas = []
+    liberar = threading.Event()
+
+    def obter_stream_com_audio(url, *args, **kwargs):
+        chamadas.append(threading.current_thread().name)
+        liberar.wait(5)
+        return push.ResultadoCanal("https://h/a.m3u8", "A", "ao_vivo")
+    monkeypatch.setattr(push, "obter_stream_com_audio", obter_stream_com_audio)
+    resolvedor = push.ResolvedorSobDemanda(push.CacheStreams(caminho=None), pre_checagem=False, trabalhadores=2)
+
+    respostas = []
+
+    def pedir():
+        respostas.append(resolvedor.resolver("https://www.youtube.com/@a/live"))
+    pedidos = [threading.Thread(target=pedir) for _ in range(5)]
+    for pedido in pedidos:
+        pedido.start()
+    time.sleep(0.1)
+    liberar.set()
+    for pedido in pedidos:
+        pedido.join()
+    resolvedor.fechar()
+    assert respostas == [("https://h/a.m3u8", 0.0)] * 5
+    assert len(chamadas) == 1 and chamadas[0].startswith("sob-demanda")
+    assert resolvedor.resolver("https://www.youtube.com/@a/live") == ("https://h/a.m3u8", 0.0)
+    assert len(chamadas) == 1
+
+
+def test_resolvedor_sob_demanda_circuito_aberto_nao_vira_offline(monkeypatch):
+    monkeypatch.setattr(push, "obter_stream_com_audio",
+                        lambda *args, **kwargs: push.ResultadoCanal(None, "a", "circuito_aberto", 42.0))
+    resolvedor = push.ResolvedorSobDemanda(push.CacheStreams(caminho=None), pre_checagem=False)
+    assert resolvedor.resolver("https://www.youtube.com/@a/live") == (None, 42.0)
+    assert resolvedor.cache.esta_offline("https://www.youtube.com/@a/live") is None
+    resolvedor.fechar()
@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import setup_and_run  # noqa: E402
+
+
+@pytest.fixture
+def ambiente(tmp_path, monkeypatch):
+    """Isola a impressão digital e registra o que main() chamou, sem instalar nem rodar nada."""
+    chamadas = []
+    monkeypatch.setattr(setup_and_run, "FINGERPRINT_FILE", str(tmp_path / "cache" / "ambiente.json"))
+    monkeypatch.setattr(setup_and_run, "check_python_version", lambda: None)
+    monkeypatch.setattr(setup_and_run, "install_python_deps", lambda: chamadas.append("pip"))
+    monkeypatch.setattr(setup_and_run, "install_system_deps", lambda: chamadas.append("sistema"))
+    monkeypatch.setattr(setup_and_run, "verify_installation", lambda fingerprint: chamadas.append("verificar"))
+    monkeypatch.setattr(setup_and_run, "run_push_py", lambda argv: chamadas.append(("push", argv)))
+    monkeypatch.setattr(sys, "argv", ["setup_and_run.py", "--daemon"])
+    return chamadas
+
+
+def test_primeira_execucao_verifica_e_guarda_a_impressao_digital(ambiente):
+    setup_and_run.main()
+    assert ambiente == ["pip", "sistema", "verificar", ("push", ["--daemon"])]
+    assert setup_and_run.load_fingerprint() == setup_and_run.compute_fingerprint()
+
+
+def test_ambiente_inalterado_pula_a_instalacao(ambiente):
+    setup_and_run.save_fingerprint(setup_and_run.compute_fingerprint())
+    setup_and_run.main()
+    assert ambiente == [("push", ["--daemon"])]
+
+
+def test_pacote_atualizado_refaz_a_verificacao(ambiente):
+    antiga = setup_and_run.compute_fingerprint()
+    antiga["packages"] = {nome: "0.0" for nome in antiga["packages"]}
+    setup_and_run.save_fingerprint(antiga)
+    setup_and_run.main()
+    assert ambiente[:3] == ["pip", "sistema", "verificar"]